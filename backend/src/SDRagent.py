@@ -1,6 +1,7 @@
 import os
-import json
 import logging
+import re
+import threading
 from datetime import datetime
 from typing import Dict, Any, List
 
@@ -14,6 +15,7 @@ from livekit.agents import (
     Agent,
     AgentSession,
     JobContext,
+    JobProcess,
     RunContext,
     WorkerOptions,
     cli,
@@ -25,48 +27,130 @@ from livekit.agents import (
 from livekit.plugins import google, murf, deepgram, silero
 from livekit.plugins.turn_detector.multilingual import MultilingualModel # Keep this import if you need MultilingualModel
 
+import json_utils
+
+try:
+    from watchfiles import watch
+except ImportError:  # installed with livekit-agents, but not a direct dependency
+    watch = None
+
 load_dotenv(".env.local")
 logger = logging.getLogger("sdr.agent")
 
 # --- Configuration & File Paths (Adapted for LiveKit Structure) ---
 KNOWLEDGE_FILE = 'shared-data/day5_razorpay_faq.json'
-OUTPUT_FILE = 'leads_output.json'
+OUTPUT_FILE = 'leads_output.jsonl'  # one JSON lead per line, append-only
 VOICE_SDR = "Anusha" 
 
 # --- Helper Functions (SDR Backend Logic) ---
 
+AUDIENCE_RE = re.compile(r"who|for whom|audience|customer")
+
+def build_keyword_index(entries):
+    """Maps each lowercased FAQ keyword to the index of the first entry that lists it."""
+    index = {}
+    for i, entry in enumerate(entries):
+        for kw in entry.get('keywords', []):
+            index.setdefault(kw.lower(), i)
+    return index
+
+def build_faq_matcher(keyword_index):
+    """Compiles every FAQ keyword into one lookahead alternation, listed in KB entry order."""
+    if not keyword_index:
+        return None
+    # The zero-width lookahead is tried at every position, so overlapping keywords
+    # ("gateway" inside "payment gateway") are all seen. At each position the first
+    # alternative that matches belongs to the earliest entry, because keyword_index is
+    # built in entry order.
+    return re.compile("(?=(" + "|".join(re.escape(kw) for kw in keyword_index) + "))")
+
 def load_knowledge_base(file_path):
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open(file_path, 'rb') as f:
+            knowledge_base = json_utils.loads(f.read())
     except FileNotFoundError:
         logger.error(f"Knowledge base file not found at {file_path}.")
         return None
+    # Keywords are normalized once here, so mixed-case entries like "RazorpayX" still match
+    knowledge_base['_kw_index'] = build_keyword_index(knowledge_base.get('faq_and_pricing', []))
+    knowledge_base['_faq_matcher'] = build_faq_matcher(knowledge_base['_kw_index'])
+    return knowledge_base
+
+# The parsed KB lives here; lookups read it directly and the watcher swaps in a new one
+# when the file changes, so the request path never touches the disk.
+_KB = None
+
+def get_knowledge_base():
+    global _KB
+    if _KB is None:
+        _KB = load_knowledge_base(KNOWLEDGE_FILE)
+    return _KB
+
+def reload_knowledge_base():
+    """Swaps in a freshly parsed knowledge base, keeping the current one if the file is invalid."""
+    global _KB
+    try:
+        knowledge_base = load_knowledge_base(KNOWLEDGE_FILE)
+    except (json_utils.JSONDecodeError, TypeError, AttributeError, OSError):
+        # e.g. a half-saved edit or a non-object top level; the next save triggers another try
+        logger.exception(f"Ignoring invalid knowledge base at {KNOWLEDGE_FILE}; keeping the previous one")
+        return
+    if knowledge_base is not None:
+        _KB = knowledge_base
+        logger.info(f"Reloaded knowledge base from {KNOWLEDGE_FILE}")
+
+# One watcher thread per process, shared by every job it runs
+_KB_WATCHER = None
+
+def _watch_knowledge_base():
+    for _changes in watch(KNOWLEDGE_FILE):
+        reload_knowledge_base()
+
+def start_knowledge_base_watcher():
+    """Reloads the knowledge base whenever the FAQ file is edited on disk."""
+    global _KB_WATCHER
+    if _KB_WATCHER is not None or watch is None or not os.path.exists(KNOWLEDGE_FILE):
+        return
+    # A daemon thread rather than a task, so it isn't tied to any one job's event loop
+    _KB_WATCHER = threading.Thread(target=_watch_knowledge_base, name="kb-watcher", daemon=True)
+    _KB_WATCHER.start()
 
 def find_faq_answer_sync(user_query, knowledge_base):
     query = user_query.lower()
     
-    if any(k in query for k in ["who", "for whom", "audience", "customer"]):
+    if AUDIENCE_RE.search(query):
         return f"Razorpay is for **{knowledge_base.get('target_audience', 'Indian businesses of all sizes')}**."
 
-    for entry in knowledge_base.get('faq_and_pricing', []):
-        if any(keyword in query for keyword in entry.get('keywords', [])):
-            return entry['answer']
+    matcher = knowledge_base.get('_faq_matcher')
+    if matcher is None:
+        return None
+
+    # One pass over the query; the first KB entry with any matching keyword wins, as before
+    kw_index = knowledge_base['_kw_index']
+    best = min((kw_index[m.group(1)] for m in matcher.finditer(query)), default=None)
+    if best is not None:
+        return knowledge_base['faq_and_pricing'][best]['answer']
     
     return None
 
+# Opened once per process (in prewarm, or on the first save) and kept for its lifetime.
+# With O_APPEND each lead is a single os.write, which the kernel appends atomically.
+_LEADS_FD = None
+# Saves run in asyncio.to_thread workers; without the lock two of them could both open the file
+_LEADS_FD_LOCK = threading.Lock()
+
+def _leads_fd():
+    global _LEADS_FD
+    if _LEADS_FD is None:
+        with _LEADS_FD_LOCK:
+            if _LEADS_FD is None:
+                _LEADS_FD = os.open(OUTPUT_FILE, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    return _LEADS_FD
+
 def save_lead_data_sync(lead_data):
     try:
-        if os.path.exists(OUTPUT_FILE):
-            with open(OUTPUT_FILE, 'r+') as f:
-                file_data = json.load(f)
-                file_data['leads'].append(lead_data)
-                f.seek(0)
-                json.dump(file_data, f, indent=4)
-                f.truncate()
-        else:
-            with open(OUTPUT_FILE, 'w') as f:
-                json.dump({'leads': [lead_data]}, f, indent=4)
+        # Append a single line instead of re-reading and rewriting every lead saved so far
+        os.write(_leads_fd(), json_utils.dumps_bytes(lead_data, newline=True))
         logger.info(f"Lead data successfully saved to {OUTPUT_FILE}")
     except Exception as e:
         logger.error(f"Could not save lead data: {e}", exc_info=True)
@@ -78,12 +162,12 @@ async def lookup_faq(ctx: RunContext[dict], user_query: str):
     """
     Searches the Razorpay knowledge base for answers to product, pricing, or audience questions.
     """
-    knowledge_base = load_knowledge_base(KNOWLEDGE_FILE)
+    knowledge_base = get_knowledge_base()
     if not knowledge_base:
         return {"response": "The knowledge base is currently unavailable.", "status": "error"}
     
-    # REPLACED fwd_to_async WITH asyncio.to_thread
-    answer = await asyncio.to_thread(find_faq_answer_sync, user_query, knowledge_base)
+    # The KB is already in memory, so the scan is cheap enough to run on the event loop
+    answer = find_faq_answer_sync(user_query, knowledge_base)
     
     if answer:
         return {"response": answer, "status": "answered"}
@@ -106,7 +190,7 @@ async def capture_and_save_lead(ctx: RunContext[dict], name: str, email: str, co
         "timestamp": datetime.now().isoformat()
     }
     
-    # REPLACED fwd_to_async WITH asyncio.to_thread
+    # Only the disk write still goes through a worker thread; FAQ lookups run inline
     await asyncio.to_thread(save_lead_data_sync, lead_data)
     
     return {
@@ -139,37 +223,45 @@ class SDRAgent(Agent):
 
 # --- LiveKit Entrypoint ---
 
+def prewarm(proc: JobProcess):
+    # Load the VAD model once per worker process instead of once per job
+    proc.userdata["vad"] = silero.VAD.load()
+    # Build the Gemini client up front and reuse it for every job on this worker
+    proc.userdata["llm"] = google.LLM(model="gemini-2.5-flash", api_key=os.getenv("GOOGLE_API_KEY"))
+    get_knowledge_base()
+    # Pick up FAQ edits without restarting the worker
+    start_knowledge_base_watcher()
+    try:
+        _leads_fd()
+    except OSError as e:
+        # Not fatal here; save_lead_data_sync retries the open and logs if it still fails
+        logger.warning(f"Could not open {OUTPUT_FILE}: {e}")
+
 async def entrypoint(ctx: JobContext):
     logger.info("Starting SDR Agent")
 
     # Initialize the LLM, STT, and TTS components
     session = AgentSession(
         stt=deepgram.STT(model="nova-3"),
-        llm=google.LLM(model="gemini-2.5-flash", api_key=os.getenv("GOOGLE_API_KEY")),
+        llm=ctx.proc.userdata["llm"],
         tts=murf.TTS(voice=VOICE_SDR, style="Conversation", text_pacing=True),
         turn_detection=MultilingualModel(),
-        vad=silero.VAD.load(),
+        vad=ctx.proc.userdata["vad"],
+        preemptive_generation=True,
     )
 
-    # Create and start the SDR agent
+    # Create and start the SDR agent. Starting the session before ctx.connect() lets it
+    # warm up the STT/LLM/TTS connections while the room is still being joined.
     agent = SDRAgent()
     await session.start(agent=agent, room=ctx.room)
     await ctx.connect()
 
 
 if __name__ == "__main__":
-    # Ensure the leads output file is initialized correctly before starting
-    if not os.path.exists(OUTPUT_FILE):
-        try:
-            with open(OUTPUT_FILE, 'w') as f:
-                json.dump({'leads': []}, f)
-        except Exception as e:
-            print(f"CRITICAL ERROR: Could not create output file {OUTPUT_FILE}: {e}")
-            exit()
-            
     # Run the worker to listen for incoming job requests
     cli.run_app(
         WorkerOptions(
             entrypoint_fnc=entrypoint,
+            prewarm_fnc=prewarm,
         )
     )
\ No newline at end of file
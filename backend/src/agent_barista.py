@@ -1,5 +1,5 @@
+import asyncio
 import logging
-import json
 from dataclasses import dataclass, field
 from typing import List, Optional
 
@@ -21,10 +21,19 @@ from livekit.agents import (
 from livekit.plugins import murf, silero, google, deepgram, noise_cancellation
 from livekit.plugins.turn_detector.multilingual import MultilingualModel
 
+import json_utils
+
 logger = logging.getLogger("agent")
 
 load_dotenv(".env.local")
 
+# Use uvloop for the worker's event loop when it is installed (see README, "Optional speedups")
+try:
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:
+    pass
+
 # --- 1. DEFINE THE ORDER STATE DATACLASS ---
 @dataclass
 class CoffeeOrder:
@@ -35,6 +44,16 @@ class CoffeeOrder:
     name: Optional[str] = None
 
 
+# Characters that must not reach the order filename (spaces kept readable as underscores)
+_SANITIZE = str.maketrans({' ': '_', '/': '_', '\\': '_', '\n': '_', '\r': '_', '\0': '_'})
+
+
+def write_order_file(filename: str, order_data: dict) -> None:
+    """Blocking JSON write; called through asyncio.to_thread so the voice loop keeps running."""
+    with open(filename, 'wb') as f:
+        f.write(json_utils.dumps_bytes(order_data, indent=True))
+
+
 # --- 2. THE BARISTA AGENT CLASS ---
 class BaristaAgent(Agent): # <-- RENAMED CLASS
     def __init__(self) -> None:
@@ -57,15 +76,14 @@ class BaristaAgent(Agent): # <-- RENAMED CLASS
         """Saves the final coffee order to a JSON file."""
         
         # 1. Create a descriptive filename
-        customer_name = final_order_data.get('name', 'customer').replace(' ', '_')
+        customer_name = final_order_data.get('name', 'customer').translate(_SANITIZE)
         filename = f"final_order_{customer_name}.json"
 
         # 2. Write the JSON file
         try:
-            with open(filename, 'w') as f:
-                json.dump(final_order_data, f, indent=4)
+            await asyncio.to_thread(write_order_file, filename, final_order_data)
         except Exception as e:
-            logger.error(f"Failed to save order: {e}")
+            logger.error("Failed to save order: %s", e)
             return "There was an internal error saving the order. Please ask the customer to repeat the full order."
 
         # 3. Return a response for the LLM to read to the user
@@ -77,6 +95,10 @@ def prewarm(proc: JobProcess):
 
 
 async def entrypoint(ctx: JobContext):
+    # Start new tasks eagerly so tools that never suspend skip a loop iteration (Python 3.12+)
+    if hasattr(asyncio, "eager_task_factory"):
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+
     # Logging setup
     # Add any other context you want in all log entries here
     ctx.log_context_fields = {
@@ -117,7 +139,7 @@ async def entrypoint(ctx: JobContext):
 
     async def log_usage():
         summary = usage_collector.get_summary()
-        logger.info(f"Usage: {summary}")
+        logger.info("Usage: %s", summary)
 
     ctx.add_shutdown_callback(log_usage)
 
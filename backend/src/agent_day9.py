@@ -1,12 +1,13 @@
 import os
 import logging
 import asyncio
-import json
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, Any, List, Optional
 import uuid
 import time
+import itertools
+from dataclasses import dataclass, field
 
 from dotenv import load_dotenv
 
@@ -25,23 +26,45 @@ from livekit.agents import (
 from livekit.plugins import google, murf, deepgram, silero
 from livekit.plugins.turn_detector.multilingual import MultilingualModel
 
+import json_utils
+
 load_dotenv(".env.local")
 logger = logging.getLogger("shopping.assistant.agent")
 
+# Use uvloop for the worker's event loop when it is installed (see README, "Optional speedups")
+try:
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:
+    pass
+
 # --- Product Catalog and Order Persistence (Merchant Layer) ---
 
 # File paths for persistence and catalog
 ORDERS_FILE = "orders.json"
 CATALOG_FILE = "catalog.json"
 
-# Finalized Orders (Persisted history)
-ORDERS: List[Dict[str, Any]] = []
-
-# Global Product List (Loaded from catalog.json)
-PRODUCTS: List[Dict[str, Any]] = []
-
-# --- CRITICAL NEW GLOBAL: Active Cart State (Non-persisted, transactional) ---
-ACTIVE_CART: List[Dict[str, Any]] = []
+# --- Per-session shopping state (stored as the AgentSession's userdata) ---
+@dataclass
+class SessionState:
+    # The catalog loaded in prewarm (shared by every session in the process), and the
+    # same products keyed by id
+    products: List[Dict[str, Any]] = field(default_factory=list)
+    products_by_id: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    # Active cart (non-persisted, transactional): one line per add (size/color may differ),
+    # keyed by an increasing sequence number so iteration follows the order items were added
+    cart: Dict[int, Dict[str, Any]] = field(default_factory=dict)
+    # product_id -> sequence keys of that product's lines in `cart`, for O(1) removal
+    cart_index: Dict[str, List[int]] = field(default_factory=dict)
+    cart_seq: int = 0
+    # Running sum of unit_price * quantity over the cart, kept in step by add/remove
+    cart_total: float = 0.0
+    # Orders finalized during this session
+    orders: List[Dict[str, Any]] = field(default_factory=list)
+    # This session's order writer: persist_order queues encoded lines here and the task
+    # appends them, so each session flushes only its own orders at shutdown
+    order_queue: Optional[asyncio.Queue] = None
+    order_writer_task: Optional[asyncio.Task] = None
 
 
 def load_products(file_path: str = CATALOG_FILE) -> List[Dict[str, Any]]:
@@ -53,42 +76,105 @@ def load_products(file_path: str = CATALOG_FILE) -> List[Dict[str, Any]]:
         return []
 
     try:
-        with open(file, 'r') as f:
-            products_list = json.load(f)
+        with open(file, 'rb') as f:
+            products_list = json_utils.loads(f.read())
             logger.info("Successfully loaded %d products from %s", len(products_list), file_path)
-    except json.JSONDecodeError as e:
+    except json_utils.JSONDecodeError as e:
         logger.error("Error decoding JSON from catalog file: %s", e)
     except Exception as e:
         logger.error("An unexpected error occurred while loading catalog: %s", e)
 
+    # Precompute the lowercased fields the list_products filters compare against
+    for p in products_list:
+        p["_category_lc"] = p.get("category", "").lower()
+        p["_colors_lc"] = frozenset(c.lower() for c in p.get("attributes", {}).get("color", []))
+
     return products_list
 
-# Update the global PRODUCTS list by loading the file
-PRODUCTS = load_products()
+# The catalog is loaded in prewarm, off the import path and before any job starts, and
+# handed to each session's SessionState from ctx.proc.userdata
+
+
+def get_product_by_id(state: SessionState, product_id: str) -> Optional[Dict[str, Any]]:
+    """Helper to find a product by its ID in the session's catalog."""
+    return state.products_by_id.get(product_id)
+
+# Orders are appended to orders.json as JSON lines through a single long-lived
+# O_APPEND descriptor, opened in prewarm and kept for the life of the process (every
+# session's writer shares it, so no job closes it). persist_order only enqueues the
+# encoded line; the session's background writer drains whatever has queued up and
+# appends it with one writev.
+ORDER_WRITE_BATCH = 32
+_ORDERS_FD: Optional[int] = None
+
 
+def open_orders_log() -> int:
+    """Opens the append-only orders log once per process and returns its fd."""
+    global _ORDERS_FD
+    if _ORDERS_FD is None:
+        _ORDERS_FD = os.open(ORDERS_FILE, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    return _ORDERS_FD
 
-def get_product_by_id(product_id: str) -> Optional[Dict[str, Any]]:
-    """Helper to find a product by its ID. Now uses the loaded PRODUCTS."""
-    return next((p for p in PRODUCTS if p["id"] == product_id), None)
 
-def persist_order(order: Dict[str, Any]):
-    """Adds order to the in-memory list and appends to orders.json."""
-    ORDERS.append(order)
+async def order_writer(queue: asyncio.Queue):
+    """Drains queued order lines in batches of up to ORDER_WRITE_BATCH."""
+    fd = open_orders_log()
+    while True:
+        batch = [await queue.get()]
+        while len(batch) < ORDER_WRITE_BATCH and not queue.empty():
+            batch.append(queue.get_nowait())
+        try:
+            await asyncio.to_thread(os.writev, fd, batch)
+        except Exception as e:
+            logger.error("Error writing to %s: %s", ORDERS_FILE, e)
+        finally:
+            for _ in batch:
+                queue.task_done()
+
+
+def persist_order(order: Dict[str, Any], queue: Optional[asyncio.Queue] = None):
+    """Queues the order on the session's writer queue for appending to orders.json."""
+    # Note: orders.json is line-delimited JSON (one order per line), not a JSON array.
+    line = json_utils.dumps_bytes(order, newline=True)
+    if queue is not None:
+        queue.put_nowait(line)
+        return
+    # No writer running (e.g. called outside a session): append directly
     try:
-        # Append the new order to the orders.json file
-        # Note: This simple append approach means orders.json might not be a valid JSON array.
-        # For production, you might want to load the whole file, append, and save.
-        with open(ORDERS_FILE, 'a') as f:
-            json.dump(order, f)
-            f.write('\n')
+        os.write(open_orders_log(), line)
     except Exception as e:
         logger.error("Error writing to %s: %s", ORDERS_FILE, e)
 
 
+def describe_line_item(item: Dict[str, Any]) -> str:
+    """One-line description of a cart/order line: quantity, name, and size/color if set."""
+    size, color = item.get('size'), item.get('color')
+    if size and color:
+        attrs = f" (Size: {size}, Color: {color})"
+    elif size or color:
+        attrs = f" (Size: {size})" if size else f" (Color: {color})"
+    else:
+        attrs = ""
+    return f"{item['quantity']}x {item['product_name']}{attrs}"
+
+
+def summarize_product(index: int, product: Dict[str, Any]) -> Dict[str, Any]:
+    """The short, LLM-facing view of a catalog product used by list_products."""
+    attributes = product.get('attributes', {})
+    return {
+        "index": index,
+        "id": product["id"],
+        "name": product["name"],
+        "price": f"{product['price']} {product['currency']}",
+        "category": product["category"],
+        "description_summary": f"Sizes: {', '.join(map(str, attributes.get('size', [])))}. Colors: {', '.join(attributes.get('color', []))}"
+    }
+
+
 # --- Merchant Functions (LLM Tools) ---
 
 @function_tool
-async def list_products(ctx: RunContext, filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+async def list_products(ctx: RunContext[SessionState], filters: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
     Retrieves and filters the product catalog based on provided criteria.
     Args:
@@ -96,50 +182,39 @@ async def list_products(ctx: RunContext, filters: Dict[str, Any]) -> List[Dict[s
     Returns:
         A list of products matching the filters, including a short summary.
     """
-    filtered_list = PRODUCTS
-
-    # 1. Filter by Category
+    # Lowercase the query values once; the products' lowercase fields are precomputed at load
     category = filters.get("category")
-    if category:
-        filtered_list = [p for p in filtered_list if p.get("category", "").lower() == category.lower()]
+    category_lc = category.lower() if category else None
+    color = filters.get("color")
+    color_lc = color.lower() if color else None
 
-    # 2. Filter by Max Price
+    # An unparseable max price is ignored rather than rejecting the query
     max_price = filters.get("max_price")
-    if max_price is not None:
+    if isinstance(max_price, str):
         try:
-            max_price = float(max_price) if isinstance(max_price, str) else max_price
-            filtered_list = [p for p in filtered_list if p.get("price", 0) <= max_price]
+            max_price = float(max_price)
         except ValueError:
-            pass
-
-    # 3. Filter by Color
-    color = filters.get("color")
-    if color:
-        filtered_list = [p for p in filtered_list if p.get("attributes", {}).get("color") and color.lower() in [c.lower() for c in p['attributes']['color']]]
-
-    # Prepare the output summary for the LLM (only top 5)
-    product_summaries = []
-    for i, product in enumerate(filtered_list):
-        summary = {
-            "index": i + 1,
-            "id": product["id"],
-            "name": product["name"],
-            "price": f"{product['price']} {product['currency']}",
-            "category": product["category"],
-            "description_summary": f"Sizes: {', '.join(map(str, product.get('attributes', {}).get('size', [])))}. Colors: {', '.join(product.get('attributes', {}).get('color', []))}"
-        }
-        product_summaries.append(summary)
+            max_price = None
+
+    # Category, max price and color checked in a single lazy pass over the catalog
+    matches = (
+        p for p in ctx.userdata.products
+        if (not category_lc or p["_category_lc"] == category_lc)
+        and (max_price is None or p.get("price", 0) <= max_price)
+        and (not color_lc or color_lc in p["_colors_lc"])
+    )
 
-    return product_summaries[:5]
+    # Prepare the output summary for the LLM; the scan stops at the 5th match
+    return [summarize_product(i, p) for i, p in enumerate(itertools.islice(matches, 5), 1)]
 
 @function_tool
-async def add_item_to_cart(ctx: RunContext, product_id: str, quantity: int = 1, size: Optional[str] = None, color: Optional[str] = None) -> Dict[str, Any]:
+async def add_item_to_cart(ctx: RunContext[SessionState], product_id: str, quantity: int = 1, size: Optional[str] = None, color: Optional[str] = None) -> Dict[str, Any]:
     """
-    Adds a specified quantity of a product to the global active shopping cart (ACTIVE_CART).
+    Adds a specified quantity of a product to the active shopping cart.
     Returns the updated cart summary.
     """
-    global ACTIVE_CART
-    product = get_product_by_id(product_id)
+    state = ctx.userdata
+    product = get_product_by_id(state, product_id)
 
     if not product:
         return {"error": f"Product with ID {product_id} not found."}
@@ -149,80 +224,72 @@ async def add_item_to_cart(ctx: RunContext, product_id: str, quantity: int = 1,
         return {"error": f"Size {size} not available for {product['name']}."}
 
     # Add the item to the cart
-    ACTIVE_CART.append({
+    state.cart_seq += 1
+    state.cart_index.setdefault(product_id, []).append(state.cart_seq)
+    state.cart[state.cart_seq] = {
         "product_id": product_id,
         "product_name": product["name"],
         "quantity": quantity,
         "unit_price": product["price"],
         "size": size,
         "color": color
-    })
+    }
+    state.cart_total += product["price"] * quantity
 
     return await view_cart_summary(ctx)
 
 @function_tool
-async def remove_item_from_cart(ctx: RunContext, product_id: str) -> Dict[str, Any]:
+async def remove_item_from_cart(ctx: RunContext[SessionState], product_id: str) -> Dict[str, Any]:
     """
     Removes ALL instances of a specific product ID from the active shopping cart.
     Returns the updated cart summary.
     """
-    global ACTIVE_CART
-
-    initial_length = len(ACTIVE_CART)
+    state = ctx.userdata
 
-    # Filter the cart, keeping only items that do NOT match the product_id
-    ACTIVE_CART = [item for item in ACTIVE_CART if item["product_id"] != product_id]
+    # Drop every line for this product via the index, without scanning the cart
+    keys = state.cart_index.pop(product_id, None)
 
-    if len(ACTIVE_CART) < initial_length:
+    if keys:
+        removed = [state.cart.pop(key) for key in keys]
+        state.cart_total -= sum(item["unit_price"] * item["quantity"] for item in removed)
         return await view_cart_summary(ctx)
     else:
-        return {"status": f"Error: Product ID {product_id} was not found in the cart.", "current_cart_size": len(ACTIVE_CART)}
+        return {"status": f"Error: Product ID {product_id} was not found in the cart.", "current_cart_size": len(state.cart)}
 
 @function_tool
-async def view_cart_summary(ctx: RunContext) -> Dict[str, Any]:
+async def view_cart_summary(ctx: RunContext[SessionState]) -> Dict[str, Any]:
     """
-    Calculates the total sum and returns a concise summary of the items currently in the ACTIVE_CART.
+    Calculates the total sum and returns a concise summary of the items currently in the active cart.
     """
-    global ACTIVE_CART
-    if not ACTIVE_CART:
+    state = ctx.userdata
+    if not state.cart:
         return {"status": "The active shopping cart is currently empty."}
 
-    grand_total = 0.0
-    item_summaries = []
-
-    for item in ACTIVE_CART:
-        grand_total += item["unit_price"] * item["quantity"]
-
-        attrs = []
-        if item.get('size'): attrs.append(f"Size: {item['size']}")
-        if item.get('color'): attrs.append(f"Color: {item['color']}")
-
-        details = f"{item['quantity']}x {item['product_name']}"
-        if attrs:
-            details += f" ({', '.join(attrs)})"
-        item_summaries.append(details)
+    grand_total = state.cart_total
+    cart_items = list(state.cart.values())
+    item_summaries = [describe_line_item(item) for item in cart_items]
 
     # Note: Using a default currency if the cart is empty or product lacks it
-    currency = ACTIVE_CART[0].get("currency", "USD") if ACTIVE_CART else "USD"
+    currency = cart_items[0].get("currency", "USD") if cart_items else "USD"
 
     return {
         "status": "Current Cart Contents",
-        "total_items": len(ACTIVE_CART),
+        "total_items": len(cart_items),
         "total_sum": f"{round(grand_total, 2)} {currency}",
         "item_details": item_summaries
     }
 
 
 @function_tool
-async def create_order(ctx: RunContext, items_to_purchase: List[Dict[str, Any]] = []) -> Dict[str, Any]:
+async def create_order(ctx: RunContext[SessionState], items_to_purchase: List[Dict[str, Any]] = []) -> Dict[str, Any]:
     """
-    Finalizes the purchase. Uses the provided items_to_purchase list OR the global ACTIVE_CART.
-    Calculates the total sum, persists the order, and clears the ACTIVE_CART.
+    Finalizes the purchase. Uses the provided items_to_purchase list OR the active cart.
+    Calculates the total sum, persists the order, and clears the active cart.
     """
-    global ACTIVE_CART
+    state = ctx.userdata
 
     # Determine the source of items: passed list takes precedence, otherwise use active cart.
-    items_source = items_to_purchase if items_to_purchase else ACTIVE_CART
+    items_source = items_to_purchase if items_to_purchase else list(state.cart.values())
 
     if not items_source:
         return {"error": "Cannot place order: No items provided or found in the active cart."}
@@ -235,7 +302,7 @@ async def create_order(ctx: RunContext, items_to_purchase: List[Dict[str, Any]]
         product_id = item_data.get("product_id")
         quantity = int(item_data.get("quantity", 1))
 
-        product = get_product_by_id(product_id)
+        product = get_product_by_id(state, product_id)
 
         # Validation checks (omitted for brevity, assume valid if it came from the cart)
         if not product:
@@ -261,19 +328,25 @@ async def create_order(ctx: RunContext, items_to_purchase: List[Dict[str, Any]]
 
     # Final Order Object
     order_id = str(uuid.uuid4())
+    # One clock read for both timestamps; isoformat(' ', 'seconds') gives the same text as "%Y-%m-%d %H:%M:%S"
+    created_at = time.time_ns() // 1_000_000_000
     order = {
         "id": order_id,
         "items": line_items,
         "total": round(grand_total, 2),
         "currency": currency,
-        "created_at": int(time.time()),
-        "timestamp_iso": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        "created_at": created_at,
+        "timestamp_iso": datetime.fromtimestamp(created_at).isoformat(' ', 'seconds')
     }
 
-    persist_order(order)
+    state.orders.append(order)
+    # Only enqueues the write; the background order writer does the disk I/O
+    persist_order(order, state.order_queue)
 
     # --- CRITICAL: Clear the Active Cart after successful order ---
-    ACTIVE_CART = []
+    state.cart = {}
+    state.cart_index = {}
+    state.cart_total = 0.0
 
     # Prepare the summary for the LLM
     item_summaries = [f"{item['quantity']}x {item['product_name']}" for item in line_items]
@@ -287,29 +360,20 @@ async def create_order(ctx: RunContext, items_to_purchase: List[Dict[str, Any]]
 
 
 @function_tool
-async def get_last_order_summary(ctx: RunContext) -> Dict[str, Any]:
+async def get_last_order_summary(ctx: RunContext[SessionState]) -> Dict[str, Any]:
     """
     Retrieves a summary of the most recently placed order.
     Returns:
         A dictionary containing the last order's summary or a 'no order' message.
     """
-    if not ORDERS:
+    orders = ctx.userdata.orders
+    if not orders:
         return {"status": "No orders found in this session."}
 
-    last_order = ORDERS[-1]
+    last_order = orders[-1]
 
     # Create a concise summary
-    summary_items = []
-    for item in last_order["items"]:
-        # Concatenate name, quantity, and attributes (size/color)
-        attrs = []
-        if item.get('size'): attrs.append(f"Size: {item['size']}")
-        if item.get('color'): attrs.append(f"Color: {item['color']}")
-
-        details = f"{item['quantity']}x {item['product_name']}"
-        if attrs:
-            details += f" ({', '.join(attrs)})"
-        summary_items.append(details)
+    summary_items = [describe_line_item(item) for item in last_order["items"]]
 
     summary = {
         "status": "Success",
@@ -338,7 +402,7 @@ class Assistant(Agent):
                 * When a user indicates a desire to buy an item, use **`add_item_to_cart`**.
                 * When a user asks to remove an item or see what they have, use **`remove_item_from_cart`** or **`view_cart_summary`**.
                 
-            3. **Ordering & Finalizing:** When the user says "I'll check out" or "Finalize the order," call **`create_order`** *without* the `items_to_purchase` list (or pass an empty list `[]`). The function will automatically process and clear the items in the `ACTIVE_CART`.
+            3. **Ordering & Finalizing:** When the user says "I'll check out" or "Finalize the order," call **`create_order`** *without* the `items_to_purchase` list (or pass an empty list `[]`). The function will automatically process and clear the items in the active cart.
             
             4. **Confirmation:** After placing an order, confirm the details (items and the **total sum**) back to the user.
             
@@ -352,8 +416,31 @@ class Assistant(Agent):
 
 def prewarm(proc: JobProcess):
     proc.userdata["vad"] = silero.VAD.load()
+    catalog = load_products()
+    proc.userdata["catalog"] = catalog
+    proc.userdata["catalog_by_id"] = {p["id"]: p for p in catalog}
+    open_orders_log()
 
 async def entrypoint(ctx: JobContext):
+    # Cart tools are pure in-memory work; run new tasks eagerly where asyncio supports it (3.12+)
+    if hasattr(asyncio, "eager_task_factory"):
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+
+    state = SessionState(
+        products=ctx.proc.userdata["catalog"],
+        products_by_id=ctx.proc.userdata["catalog_by_id"],
+        order_queue=asyncio.Queue(),
+    )
+    state.order_writer_task = asyncio.create_task(order_writer(state.order_queue))
+
+    async def flush_orders():
+        # Make sure every queued order reaches disk before the job exits; the shared
+        # orders fd stays open for other sessions in this process
+        await state.order_queue.join()
+        state.order_writer_task.cancel()
+
+    ctx.add_shutdown_callback(flush_orders)
+
     # Initialize the LLM, STT, and TTS components
     session = AgentSession(
         stt=deepgram.STT(model="nova-3"),
@@ -362,6 +449,7 @@ async def entrypoint(ctx: JobContext):
         turn_detection=MultilingualModel(),
         vad=ctx.proc.userdata["vad"],
         preemptive_generation=True,
+        userdata=state,
     )
 
     await session.start(
@@ -1,6 +1,9 @@
 import os
-import json
+import contextlib
+import glob
 import logging
+import time
+import functools
 from typing import Dict, Any
 import asyncio 
 
@@ -11,6 +14,7 @@ from livekit.agents import (
     Agent,
     AgentSession,
     JobContext,
+    JobProcess,
     WorkerOptions,
     cli,
     function_tool,
@@ -20,12 +24,27 @@ from livekit.agents import (
 from livekit.plugins import google, murf, deepgram, silero
 from livekit.plugins.turn_detector.multilingual import MultilingualModel 
 
+import json_utils
+
 load_dotenv(".env.local")
 # Set logging to INFO, but run with LOG_LEVEL=DEBUG in terminal for detailed error messages
 logger = logging.getLogger("fraud.agent")
 
+# Use uvloop for the worker's event loop when it is installed (see README, "Optional speedups")
+try:
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:
+    pass
+
 # --- Configuration & File Paths ---
 FRAUD_DB_FILE = 'fraud_cases.json' 
+FRAUD_UPDATES_FILE = 'fraud_case_updates.jsonl'  # append-only journal, folded into the DB on shutdown
+# Compaction renames the journal to one of these before folding it in, so appends from
+# other jobs start a fresh journal instead of landing in a file that is about to be deleted
+FRAUD_UPDATES_CLAIMED_GLOB = FRAUD_UPDATES_FILE + '.*.compacting'
+FRAUD_COMPACT_LOCK = FRAUD_DB_FILE + '.lock'
+COMPACT_LOCK_STALE_SECONDS = 300
 VOICE_FRAUD_REP = "Alicia" # CHANGED: A professional, calm voice for a fraud representative
 TARGET_CUSTOMER_NAME = "Elias Vance" # The single MVP customer
 
@@ -33,72 +52,175 @@ TARGET_CUSTOMER_NAME = "Elias Vance" # The single MVP customer
 
 def initialize_database_file():
     """Creates the initial fraud_cases.json file with one pending case for the MVP."""
-    if not os.path.exists(FRAUD_DB_FILE):
-        print(f"Creating initial {FRAUD_DB_FILE}...")
-        initial_case = [
-            {
-                "case_id": "FC00129",
-                "customer_name": TARGET_CUSTOMER_NAME,
-                "security_id": "EV-2983",
-                "masked_card": "**** **** **** 7311",
-                "transaction_amount": 985.50,
-                "merchant_name": "Global Tech Imports",
-                "location": "Los Angeles, CA",
-                "timestamp": "2025-11-26 18:45 PST",
-                "security_q_answer": "2983",  # The answer for verification
-                "status": "pending_review",
-                "outcome_note": "Initial case creation."
-            }
-        ]
-        with open(FRAUD_DB_FILE, 'w') as f:
-            json.dump(initial_case, f, indent=4)
-        print("Database file created with one pending case.")
+    # O_EXCL makes the existence check and the create one atomic step
+    try:
+        fd = os.open(FRAUD_DB_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    except FileExistsError:
+        return
+    print(f"Creating initial {FRAUD_DB_FILE}...")
+    initial_case = [
+        {
+            "case_id": "FC00129",
+            "customer_name": TARGET_CUSTOMER_NAME,
+            "security_id": "EV-2983",
+            "masked_card": "**** **** **** 7311",
+            "transaction_amount": 985.50,
+            "merchant_name": "Global Tech Imports",
+            "location": "Los Angeles, CA",
+            "timestamp": "2025-11-26 18:45 PST",
+            "security_q_answer": "2983",  # The answer for verification
+            "status": "pending_review",
+            "outcome_note": "Initial case creation."
+        }
+    ]
+    try:
+        os.write(fd, json_utils.dumps_bytes(initial_case, indent=True))
+    finally:
+        os.close(fd)
+    print("Database file created with one pending case.")
+
+def _claimed_journals() -> list:
+    """Journals renamed by a compaction that hasn't finished (or crashed), oldest first."""
+    paths = []
+    for path in glob.glob(FRAUD_UPDATES_CLAIMED_GLOB):
+        # FileNotFoundError: another compaction just finished with it
+        with contextlib.suppress(FileNotFoundError):
+            paths.append((os.path.getmtime(path), path))
+    return [path for _, path in sorted(paths)]
+
+def read_case_updates_sync(paths: list | None = None) -> Dict[str, Dict[str, Any]]:
+    """Returns the latest journaled status/outcome_note per case_id."""
+    if paths is None:
+        # Claimed journals hold older entries than the live one, so read them first
+        paths = [*_claimed_journals(), FRAUD_UPDATES_FILE]
+    updates: Dict[str, Dict[str, Any]] = {}
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    # A crash mid-append leaves a torn line; skip it so one bad record
+                    # can't hide every case (or wedge compaction) from then on
+                    try:
+                        entry = json_utils.loads(line)
+                    except json_utils.JSONDecodeError:
+                        logger.warning("Skipping an undecodable line in %s", path)
+                        continue
+                    if not isinstance(entry, dict) or not {'case_id', 'status', 'outcome_note'} <= entry.keys():
+                        logger.warning("Skipping a malformed update in %s: %r", path, entry)
+                        continue
+                    updates[entry['case_id']] = entry
+        except FileNotFoundError:
+            pass
+    return updates
 
 def load_fraud_case_sync(customer_name: str) -> Dict[str, Any] | None:
-    """Loads the specific case from the mock DB."""
+    """Loads the specific case from the mock DB, with any journaled updates applied."""
     try:
-        with open(FRAUD_DB_FILE, 'r') as f:
-            cases = json.load(f)
+        with open(FRAUD_DB_FILE, 'rb') as f:
+            cases = json_utils.loads(f.read())
             for case in cases:
                 # This line requires 'case' to be a dictionary, not a string
                 if case['customer_name'] == customer_name: 
+                    update = read_case_updates_sync().get(case.get('case_id'))
+                    if update:
+                        case['status'] = update['status']
+                        case['outcome_note'] = update['outcome_note']
                     return case
             return None
     except FileNotFoundError:
-        logger.error(f"Fraud DB file not found at {FRAUD_DB_FILE}.")
+        logger.error("Fraud DB file not found at %s.", FRAUD_DB_FILE)
         return None
     except Exception:
         # Added this to catch corruption errors in the JSON file
-        logger.exception(f"Error reading and parsing data from {FRAUD_DB_FILE}.")
+        logger.exception("Error reading and parsing data from %s.", FRAUD_DB_FILE)
         return None 
 
 def update_fraud_case_sync(updated_case_data: Dict[str, Any]) -> bool:
-    """Updates the status and note in the mock DB file."""
-    try:
-        with open(FRAUD_DB_FILE, 'r') as f:
-            cases = json.load(f)
-    except:
-        cases = []
-
-    # Find and replace the specific case by case_id
-    found = False
-    for i, case in enumerate(cases):
-        if case.get('case_id') == updated_case_data.get('case_id'):
-            # Update only the status and outcome_note fields
-            cases[i]['status'] = updated_case_data['status']
-            cases[i]['outcome_note'] = updated_case_data['outcome_note']
-            found = True
-            break
-    
-    # Write the modified list back to the file
-    with open(FRAUD_DB_FILE, 'w') as f:
-        json.dump(cases, f, indent=4)
+    """Records the new status and note in the append-only updates journal."""
+    entry = {
+        'case_id': updated_case_data.get('case_id'),
+        'status': updated_case_data['status'],
+        'outcome_note': updated_case_data['outcome_note'],
+    }
+    # One small append instead of re-encoding and rewriting the whole DB file
+    blob = json_utils.dumps_bytes(entry, newline=True)
+    with open(FRAUD_UPDATES_FILE, 'a+b') as f:
+        if f.seek(0, os.SEEK_END) > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                # The previous append was torn; start a fresh line so this record isn't glued to it
+                blob = b"\n" + blob
+        f.write(blob)
 
     # Console log for debugging (MVP requirement)
-    logger.info(f"DB UPDATE: Case {updated_case_data.get('case_id')} set to status: {updated_case_data['status']}")
-    logger.info(f"DB OUTCOME NOTE: {updated_case_data['outcome_note']}")
+    logger.info("DB UPDATE: Case %s set to status: %s", entry['case_id'], entry['status'])
+    logger.info("DB OUTCOME NOTE: %s", entry['outcome_note'])
     return True
 
+def _acquire_compact_lock() -> bool:
+    """Takes the cross-process compaction lock (O_EXCL create); False if another job holds it."""
+    try:
+        os.close(os.open(FRAUD_COMPACT_LOCK, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
+        return True
+    except FileExistsError:
+        pass
+    try:
+        # A job that died mid-compaction leaves the lock behind; take it over once it's old
+        if time.time() - os.path.getmtime(FRAUD_COMPACT_LOCK) < COMPACT_LOCK_STALE_SECONDS:
+            return False
+        os.remove(FRAUD_COMPACT_LOCK)
+        os.close(os.open(FRAUD_COMPACT_LOCK, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
+        return True
+    except (FileNotFoundError, FileExistsError):
+        return False
+
+def compact_fraud_db_sync():
+    """Folds the updates journal back into fraud_cases.json and clears the journal."""
+    if not _acquire_compact_lock():
+        # Another job is compacting; anything left over is folded in by the next one
+        return
+    try:
+        # No live journal just means nothing new since the last compaction
+        with contextlib.suppress(FileNotFoundError):
+            os.replace(FRAUD_UPDATES_FILE, f"{FRAUD_UPDATES_FILE}.{os.getpid()}.compacting")
+        # Includes journals a crashed compaction claimed but never folded in
+        claimed = _claimed_journals()
+        if not claimed:
+            return
+        # A job that opened the journal just before the rename may still append to it
+        sizes = {path: os.path.getsize(path) for path in claimed}
+        updates = read_case_updates_sync(claimed)
+
+        try:
+            with open(FRAUD_DB_FILE, 'rb') as f:
+                cases = json_utils.loads(f.read())
+        except (OSError, json_utils.JSONDecodeError):
+            # Never replace an unreadable DB; the claimed journals stay and are still applied on read
+            logger.exception("Cannot read %s; leaving the updates journal uncompacted.", FRAUD_DB_FILE)
+            return
+
+        for case in cases:
+            update = updates.get(case.get('case_id'))
+            if update:
+                # Update only the status and outcome_note fields
+                case['status'] = update['status']
+                case['outcome_note'] = update['outcome_note']
+
+        # Write the modified list to a temp file and swap it in, so readers never see a partial DB
+        tmp_path = FRAUD_DB_FILE + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(json_utils.dumps_bytes(cases, indent=True))
+        os.replace(tmp_path, FRAUD_DB_FILE)
+        # Only now are the claimed updates safely in the DB; a journal that grew since we
+        # read it is kept so the next compaction folds in the late entry too
+        for path in claimed:
+            if os.path.getsize(path) == sizes[path]:
+                os.remove(path)
+    finally:
+        os.remove(FRAUD_COMPACT_LOCK)
+
 # --- LLM Tool for Fraud Case Logic ---
 
 @function_tool
@@ -108,11 +230,11 @@ async def handle_final_fraud_status(ctx: RunContext[dict], case_id: str, status:
     Status must be one of: 'confirmed_safe', 'confirmed_fraud', or 'verification_failed'.
     """
     
-    # Reload the original case to ensure we retain all original fields
-    original_case = await asyncio.to_thread(load_fraud_case_sync, TARGET_CUSTOMER_NAME) 
+    # The case loaded at job start, kept on the session so the handler doesn't re-read the DB
+    original_case = ctx.userdata.get("case")
     
     if not original_case:
-        logger.error(f"Failed to load case {case_id} for update.")
+        logger.error("Failed to load case %s for update.", case_id)
         return {"status": "error", "verbal_summary": "I am sorry, I encountered an internal error. Please call back later."}
 
     # Update the status and note on the full case data structure
@@ -128,6 +250,42 @@ async def handle_final_fraud_status(ctx: RunContext[dict], case_id: str, status:
         "verbal_summary": f"Thank you for your time. We have updated your case to status: {status}. We are now taking the action of: {outcome_note.split('.')[0]}."
     }
 
+# --- Instructions ---
+
+@functools.lru_cache(maxsize=16)
+def build_instructions(
+    case_id: str,
+    customer_name: str,
+    security_q_answer: str,
+    transaction_amount: float,
+    merchant_name: str,
+    location: str,
+    timestamp: str,
+    masked_card: str,
+) -> str:
+    """Renders the case-specific system prompt; repeat calls for the same case reuse the string."""
+    return f"""You are AVA, a highly professional, calm, and reassuring Fraud Detection Representative for PHOENIX FINANCIAL.
+        
+        You are handling **Case ID {case_id}** for customer **{customer_name}**.
+        
+        You **MUST** follow this exact flow:
+        1. GREETING & INTENT: Start with the script: "Thank you for calling Phoenix Financial. My name is Ava, and I am a Fraud Protection Representative. I am calling regarding a suspicious transaction on your account."
+        2. VERIFICATION: Immediately ask for the last four digits of the user's Security Identifier. **The correct answer is '{security_q_answer}'**.
+            * If the user answers correctly, proceed to Step 3.
+            * If the user answers incorrectly, politely state you cannot proceed, then call the `handle_final_fraud_status` tool with `case_id='{case_id}'`, `status='verification_failed'`, and `outcome_note='Identity confirmation failed by user. Call ended.'`. Speak the tool's verbal summary and hang up.
+        3. TRANSACTION DISCLOSURE: Once verified, read the suspicious transaction details to the user:
+            * Amount: ${transaction_amount:.2f}
+            * Merchant: {merchant_name}
+            * Location/Time: {location} yesterday at {timestamp.split()[-2]}
+            * Card: Ending in {masked_card.split()[-1]}
+        4. CONFIRMATION: Ask the user clearly: "**Did you authorize this transaction? Please answer Yes or No.**"
+        5. CLOSURE:
+            * If the user says YES (legitimate): Call `handle_final_fraud_status` with `case_id='{case_id}'`, `status='confirmed_safe'`, and `outcome_note='Customer confirmed transaction as legitimate. Alert removed.'`. Speak the summary and hang up.
+            * If the user says NO (fraudulent): Call `handle_final_fraud_status` with `case_id='{case_id}'`, `status='confirmed_fraud'`, and `outcome_note='Customer denied transaction. Card blocked, dispute filed, new card being issued.'`. Speak the summary and hang up.
+
+        Do not ask for full card numbers, PINs, or credentials.
+    """
+
 # --- The Fraud Agent Class ---
 
 class FraudAgent(Agent):
@@ -142,40 +300,42 @@ class FraudAgent(Agent):
 
 # --- LiveKit Entrypoint (UPDATED with dynamic data loading) ---
 
+def prewarm(proc: JobProcess):
+    # Load the VAD model before a job arrives, not inside the async entrypoint
+    proc.userdata["vad"] = silero.VAD.load()
+
 async def entrypoint(ctx: JobContext):
     logger.info("Starting Fraud Agent and Loading Case Data...")
+    # Eager tasks skip a scheduling round trip for tool calls that finish without awaiting (3.12+)
+    if hasattr(asyncio, "eager_task_factory"):
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+
+
+    async def compact_db():
+        await asyncio.to_thread(compact_fraud_db_sync)
+
+    ctx.add_shutdown_callback(compact_db)
     
     # --- 1. Load the single MVP case from the database ---
     fraud_case_data = await asyncio.to_thread(load_fraud_case_sync, TARGET_CUSTOMER_NAME)
 
     if not fraud_case_data:
-        logger.error(f"FATAL: Could not load fraud case for {TARGET_CUSTOMER_NAME}. Ending job.")
+        logger.error("FATAL: Could not load fraud case for %s. Ending job.", TARGET_CUSTOMER_NAME)
         # Attempt to disconnect if loading fails
         await ctx.disconnect() 
         return
 
-    # --- 2. Dynamically build the LLM Instructions ---
-    dynamic_instructions = f"""You are AVA, a highly professional, calm, and reassuring Fraud Detection Representative for PHOENIX FINANCIAL.
-        
-        You are handling **Case ID {fraud_case_data['case_id']}** for customer **{fraud_case_data['customer_name']}**.
-        
-        You **MUST** follow this exact flow:
-        1. GREETING & INTENT: Start with the script: "Thank you for calling Phoenix Financial. My name is Ava, and I am a Fraud Protection Representative. I am calling regarding a suspicious transaction on your account."
-        2. VERIFICATION: Immediately ask for the last four digits of the user's Security Identifier. **The correct answer is '{fraud_case_data['security_q_answer']}'**.
-            * If the user answers correctly, proceed to Step 3.
-            * If the user answers incorrectly, politely state you cannot proceed, then call the `handle_final_fraud_status` tool with `case_id='{fraud_case_data['case_id']}'`, `status='verification_failed'`, and `outcome_note='Identity confirmation failed by user. Call ended.'`. Speak the tool's verbal summary and hang up.
-        3. TRANSACTION DISCLOSURE: Once verified, read the suspicious transaction details to the user:
-            * Amount: ${fraud_case_data['transaction_amount']:.2f}
-            * Merchant: {fraud_case_data['merchant_name']}
-            * Location/Time: {fraud_case_data['location']} yesterday at {fraud_case_data['timestamp'].split()[-2]}
-            * Card: Ending in {fraud_case_data['masked_card'].split()[-1]}
-        4. CONFIRMATION: Ask the user clearly: "**Did you authorize this transaction? Please answer Yes or No.**"
-        5. CLOSURE:
-            * If the user says YES (legitimate): Call `handle_final_fraud_status` with `case_id='{fraud_case_data['case_id']}'`, `status='confirmed_safe'`, and `outcome_note='Customer confirmed transaction as legitimate. Alert removed.'`. Speak the summary and hang up.
-            * If the user says NO (fraudulent): Call `handle_final_fraud_status` with `case_id='{fraud_case_data['case_id']}'`, `status='confirmed_fraud'`, and `outcome_note='Customer denied transaction. Card blocked, dispute filed, new card being issued.'`. Speak the summary and hang up.
-
-        Do not ask for full card numbers, PINs, or credentials.
-    """
+    # --- 2. Build the LLM Instructions (memoized per case) ---
+    dynamic_instructions = build_instructions(
+        fraud_case_data['case_id'],
+        fraud_case_data['customer_name'],
+        fraud_case_data['security_q_answer'],
+        fraud_case_data['transaction_amount'],
+        fraud_case_data['merchant_name'],
+        fraud_case_data['location'],
+        fraud_case_data['timestamp'],
+        fraud_case_data['masked_card'],
+    )
 
     # Initialize the LLM, STT, and TTS components
     session = AgentSession(
@@ -183,7 +343,8 @@ async def entrypoint(ctx: JobContext):
         llm=google.LLM(model="gemini-2.5-flash", api_key=os.getenv("GOOGLE_API_KEY")),
         tts=murf.TTS(voice=VOICE_FRAUD_REP, style="Conversation", text_pacing=True), 
         turn_detection=MultilingualModel(),
-        vad=silero.VAD.load(),
+        vad=ctx.proc.userdata["vad"],
+        userdata={"case": fraud_case_data},
     )
 
     # --- 3. Pass the dynamic instructions to the agent ---
@@ -200,5 +361,6 @@ if __name__ == "__main__":
     cli.run_app(
         WorkerOptions(
             entrypoint_fnc=entrypoint,
+            prewarm_fnc=prewarm,
         )
     )
\ No newline at end of file
@@ -16,9 +16,9 @@ Day 4 - Teach-the-Tutor Agent (fixed version)
 
 import os
 import re
-import json
+import asyncio
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 
 from dotenv import load_dotenv
@@ -38,6 +38,8 @@ from livekit.agents import (
 from livekit.plugins import google, murf, deepgram, silero, noise_cancellation
 from livekit.plugins.turn_detector.multilingual import MultilingualModel
 
+import json_utils
+
 load_dotenv(".env.local")
 logger = logging.getLogger("day4.tutor")
 
@@ -56,91 +58,226 @@ VOICE_LEARN = "Matthew"
 VOICE_QUIZ = "Anusha"
 VOICE_TEACH = "Ken"
 
+# Answer / explanation tokenizer, and the single-word MCQ picks it can yield.
+# ASCII word characters only: the content and STT transcripts are English, and the
+# ASCII class scans noticeably faster than Unicode \w.
+_RE_WORD = re.compile(r"\w+", re.ASCII)
+_LETTER_TOKENS = frozenset("abcd")
+_DIGIT_TOKENS = frozenset("1234")
+
 # -----------------------
 # Helpers: load/save
 # -----------------------
+# Parsed content, reused until the file's mtime changes (tools hit this on every call)
+_content_cache: Dict[str, Any] = {"mtime": None, "content": [], "by_id": {}}
+
+def _read_content() -> List[Dict[str, Any]]:
+    with open(CONTENT_PATH, "rb") as f:
+        content = json_utils.loads(f.read())
+    # Summaries and quiz options never change, so lowercase/tokenize them once for scoring
+    for c in content:
+        c["_ref_words"] = frozenset(_RE_WORD.findall((c.get("summary") or "").lower()))
+        # Content files name the question list either "quiz" or "mcq"; resolve which once
+        c["_questions"] = c.get("quiz", []) or c.get("mcq", [])
+        for q in c["_questions"]:
+            opts_lower = [o.lower() for o in q["options"]]
+            q["_opts_lower"] = opts_lower
+            q["_opts_wordsets"] = [frozenset(_RE_WORD.findall(ol)) for ol in opts_lower]
+            q["_correct_words"] = _RE_WORD.findall(opts_lower[q["answer"]])
+    return content
+
 def load_content() -> List[Dict[str, Any]]:
-    if not os.path.exists(CONTENT_PATH):
+    try:
+        mtime = os.stat(CONTENT_PATH).st_mtime
+    except FileNotFoundError:
         logger.error("Day4 content file not found at %s", CONTENT_PATH)
         return []
-    with open(CONTENT_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
+    if mtime != _content_cache["mtime"]:
+        content = _read_content()
+        _content_cache["content"] = content
+        _content_cache["by_id"] = {c["id"]: c for c in content}
+        _content_cache["mtime"] = mtime
+    return _content_cache["content"]
+
+def get_concept(cid: str) -> Optional[Dict[str, Any]]:
+    """Looks up a concept by id in the (cached) content."""
+    load_content()
+    return _content_cache["by_id"].get(cid)
 
 def load_state() -> Dict[str, Any]:
     if not os.path.exists(STATE_PATH):
         return {"last_mode": None, "last_concept": None, "mastery": {}}
     try:
-        with open(STATE_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(STATE_PATH, "rb") as f:
+            return json_utils.loads(f.read())
     except Exception as e:
         logger.warning("Failed to load state: %s", e)
         return {"last_mode": None, "last_concept": None, "mastery": {}}
 
-def save_state(state: Dict[str, Any]):
+# The state is read from disk once and then kept in memory. Tools record their changes
+# through _set_field/_bump/_record_score and call schedule_save(); a single background task
+# writes them out STATE_FLUSH_DELAY seconds later, so a burst of updates costs one write and
+# none of them block the tool call.
+#
+# Several tutor sessions (job processes) can share STATE_PATH, so a flush never writes the
+# in-memory snapshot back as-is: it re-reads the file and applies only this process's pending
+# changes on top (counters are added, last_* values overwrite). The read-merge-replace isn't
+# locked across processes, so two flushes landing in the same instant can still drop one
+# of them, but sessions no longer overwrite each other's progress wholesale.
+STATE_FLUSH_DELAY = 0.5
+_MASTERY_COUNTERS = ("times_explained", "times_quizzed", "times_taught_back", "times_scored", "score_sum")
+_state: Optional[Dict[str, Any]] = None
+_flush_task: Optional[asyncio.Task] = None
+_state_write_lock: Optional[asyncio.Lock] = None
+# Changes made since the last flush: top-level fields, and per concept counter deltas + last_score
+_pending_fields: Dict[str, Any] = {}
+_pending_mastery: Dict[str, Dict[str, Any]] = {}
+
+def get_state() -> Dict[str, Any]:
+    global _state
+    if _state is None:
+        _state = load_state()
+    return _state
+
+def _get_state_write_lock() -> asyncio.Lock:
+    # Created on first use so it belongs to the job's running loop, not whatever loop exists at import
+    global _state_write_lock
+    if _state_write_lock is None:
+        _state_write_lock = asyncio.Lock()
+    return _state_write_lock
+
+def save_state(data: bytes) -> bool:
+    # Write a sibling file and rename it over the old one, so readers never see a partial state
+    tmp_path = STATE_PATH + ".tmp"
     try:
-        with open(STATE_PATH, "w", encoding="utf-8") as f:
-            json.dump(state, f, indent=2, ensure_ascii=False)
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, STATE_PATH)
+        return True
     except Exception as e:
         logger.error("Failed to save state: %s", e)
+        return False
+
+def _apply_pending(state: Dict[str, Any], fields: Dict[str, Any], mastery: Dict[str, Dict[str, Any]]):
+    """Applies recorded changes to a state dict (the in-memory one, or a fresh copy from disk)."""
+    state.update(fields)
+    for cid, delta in mastery.items():
+        ms = _get_mastery(state, cid)
+        _carry_legacy_average(ms)
+        for field in _MASTERY_COUNTERS:
+            if field in delta:
+                ms[field] = ms.get(field, 0) + delta[field]
+        if "last_score" in delta:
+            ms["last_score"] = delta["last_score"]
+        if ms.get("times_scored"):
+            ms["avg_score"] = round(ms["score_sum"] / ms["times_scored"], 1)
+
+def _merge_and_save(fields: Dict[str, Any], mastery: Dict[str, Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Re-reads STATE_PATH, applies the changes and writes it back; returns the merged state, or None on failure."""
+    merged = load_state()
+    _apply_pending(merged, fields, mastery)
+    return merged if save_state(json_utils.dumps_bytes(merged, indent=True)) else None
+
+def _merge_pending_back(fields: Dict[str, Any], mastery: Dict[str, Dict[str, Any]]):
+    # A failed flush keeps its changes (under any made since) so the next flush retries them
+    for key, value in fields.items():
+        _pending_fields.setdefault(key, value)
+    for cid, delta in mastery.items():
+        pending = _pending_mastery.setdefault(cid, {})
+        for field in _MASTERY_COUNTERS:
+            if field in delta:
+                pending[field] = pending.get(field, 0) + delta[field]
+        if "last_score" in delta:
+            pending.setdefault("last_score", delta["last_score"])
+
+async def _write_state():
+    global _state, _pending_fields, _pending_mastery
+    async with _get_state_write_lock():
+        if not _pending_fields and not _pending_mastery:
+            return
+        # Take the pending changes on the event loop; anything recorded while the thread runs goes to the next flush
+        fields, mastery = _pending_fields, _pending_mastery
+        _pending_fields, _pending_mastery = {}, {}
+        merged = await asyncio.to_thread(_merge_and_save, fields, mastery)
+        if merged is None:
+            _merge_pending_back(fields, mastery)
+            return
+        # Adopt the merged view so reports include other sessions' progress, keeping changes made meanwhile
+        _apply_pending(merged, _pending_fields, _pending_mastery)
+        _state = merged
+
+async def _flush_after(delay: float):
+    global _flush_task
+    await asyncio.sleep(delay)
+    _flush_task = None
+    await _write_state()
+
+def schedule_save():
+    """Marks the in-memory state dirty; it is written shortly after by a background task."""
+    global _flush_task
+    if _flush_task is None:
+        _flush_task = asyncio.create_task(_flush_after(STATE_FLUSH_DELAY))
+
+async def flush_state():
+    """Writes a pending state update right away (used at shutdown)."""
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        _flush_task = None
+    # Also waits out a flush already in progress (it holds the write lock)
+    await _write_state()
 
 # -----------------------
 # Voice switching helper
 # -----------------------
-def switch_session_voice(session: AgentSession, new_voice: str):
-    """Switch the session's TTS voice by replacing the TTS instance"""
+def resolve_tts_targets(session: AgentSession) -> List[Tuple[Any, str]]:
+    """Find, once per session, every (object, attribute) that holds the session's TTS instance"""
+    targets: List[Tuple[Any, str]] = []
+    if hasattr(session, '_tts'):
+        targets.append((session, '_tts'))
+    # `tts` is only worth writing when it is settable (not a read-only property over _tts)
+    tts_attr = getattr(type(session), 'tts', None)
+    if hasattr(session, 'tts') and not (isinstance(tts_attr, property) and tts_attr.fset is None):
+        targets.append((session, 'tts'))
+    agent_output = getattr(session, '_agent_output', None)
+    if agent_output is not None and hasattr(agent_output, '_tts'):
+        targets.append((agent_output, '_tts'))
+    return targets
+
+def build_tts_pool() -> Dict[str, murf.TTS]:
+    """One Murf TTS per mode voice, built up front so a mode switch only swaps references"""
+    return {
+        voice: murf.TTS(voice=voice, style="Conversation", text_pacing=True)
+        for voice in (VOICE_LEARN, VOICE_QUIZ, VOICE_TEACH)
+    }
+
+def switch_session_voice(tts_targets: List[Tuple[Any, str]], tts_pool: Dict[str, murf.TTS], new_voice: str):
+    """Switch the session's TTS voice by swapping in the prebuilt TTS instance"""
     try:
-        logger.info(f"🎤 Switching session voice to: {new_voice}")
-        logger.info(f"Session type: {type(session)}")
-        logger.info(f"Session attributes: {[attr for attr in dir(session) if 'tts' in attr.lower()]}")
-        
-        new_tts = murf.TTS(
-            voice=new_voice,
-            style="Conversation",
-            text_pacing=True
-        )
-        
-        # Try multiple ways to replace TTS
-        updated = False
-        if hasattr(session, '_tts'):
-            old_tts = getattr(session, '_tts', None)
-            session._tts = new_tts
-            logger.info(f"Updated session._tts from {old_tts} to {new_tts}")
-            updated = True
-            
-        if hasattr(session, 'tts'):
-            old_tts = getattr(session, 'tts', None)
-            session.tts = new_tts
-            logger.info(f"Updated session.tts from {old_tts} to {new_tts}")
-            updated = True
+        new_tts = tts_pool[new_voice]
         
-        # Force update internal TTS references
-        try:
-            if hasattr(session, '_agent_output') and hasattr(session._agent_output, '_tts'):
-                session._agent_output._tts = new_tts
-                logger.info("Updated session._agent_output._tts")
-                updated = True
-        except Exception as e:
-            logger.warning(f"Could not update _agent_output._tts: {e}")
+        debug = logger.isEnabledFor(logging.DEBUG)
+        for obj, attr in tts_targets:
+            setattr(obj, attr, new_tts)
+            if debug:
+                logger.debug("Updated %s.%s", type(obj).__name__, attr)
             
-        if updated:
-            logger.info(f"✓ Session voice switched to {new_voice}")
+        if tts_targets:
+            logger.info("🎤 Session voice switched to %s", new_voice)
         else:
             logger.warning("No TTS attributes found to update")
             
-        return updated
+        return bool(tts_targets)
     except Exception as e:
-        logger.error(f"Voice switch failed: {e}", exc_info=True)
+        logger.error("Voice switch failed: %s", e, exc_info=True)
         return False
 
 # -----------------------
 # Small evaluation helpers
 # -----------------------
-def score_explanation(reference: str, user_text: str) -> Dict[str, Any]:
+def score_explanation(ref_words: frozenset, user_text: str) -> Dict[str, Any]:
     """Simple overlap-based scoring (0-100) + short feedback."""
-    def words(s):
-        return re.findall(r"\w+", (s or "").lower())
-    ref_words = set(words(reference))
-    user_words = set(words(user_text))
+    user_words = set(_RE_WORD.findall((user_text or "").lower()))
     if not ref_words:
         return {"score": 0, "feedback": "No reference available to score against."}
     common = ref_words & user_words
@@ -154,6 +291,46 @@ def score_explanation(reference: str, user_text: str) -> Dict[str, Any]:
         fb = "Nice attempt — try to state the core idea and one short example."
     return {"score": score, "feedback": fb}
 
+_MASTERY_DEFAULT = {"times_explained": 0, "times_quizzed": 0, "times_taught_back": 0, "last_score": None, "avg_score": None, "times_scored": 0, "score_sum": 0}
+
+def _get_mastery(state: Dict[str, Any], cid: str) -> Dict[str, Any]:
+    """The concept's mastery record in state, created from _MASTERY_DEFAULT on first use."""
+    mastery = state.setdefault("mastery", {})
+    ms = mastery.get(cid)
+    if ms is None:
+        ms = mastery[cid] = dict(_MASTERY_DEFAULT)
+    return ms
+
+def _carry_legacy_average(ms: Dict[str, Any]):
+    if "times_scored" not in ms and ms.get("avg_score") is not None:
+        # Record saved before counts were tracked: carry its average forward as one sample
+        ms["times_scored"], ms["score_sum"] = 1, ms["avg_score"]
+
+def _set_field(state: Dict[str, Any], key: str, value: Any):
+    """Sets a top-level state field (last_mode, last_concept) and records it for the next flush."""
+    state[key] = value
+    _pending_fields[key] = value
+
+def _bump(state: Dict[str, Any], cid: str, field: str):
+    """Increments one of the concept's mastery counters and records the delta for the next flush."""
+    ms = _get_mastery(state, cid)
+    ms[field] = ms.get(field, 0) + 1
+    delta = _pending_mastery.setdefault(cid, {})
+    delta[field] = delta.get(field, 0) + 1
+
+def _record_score(state: Dict[str, Any], cid: str, score: int):
+    """Sets last_score and keeps avg_score the true mean of every scored attempt."""
+    ms = _get_mastery(state, cid)
+    _carry_legacy_average(ms)
+    ms["times_scored"] = ms.get("times_scored", 0) + 1
+    ms["score_sum"] = ms.get("score_sum", 0) + score
+    ms["last_score"] = score
+    ms["avg_score"] = round(ms["score_sum"] / ms["times_scored"], 1)
+    delta = _pending_mastery.setdefault(cid, {})
+    delta["times_scored"] = delta.get("times_scored", 0) + 1
+    delta["score_sum"] = delta.get("score_sum", 0) + score
+    delta["last_score"] = score
+
 # -----------------------
 # Tools exposed to LLM / agent flow
 # -----------------------
@@ -169,15 +346,18 @@ async def list_concepts(ctx: RunContext[dict]):
 @function_tool
 async def set_concept(ctx: RunContext[dict], concept_id: str):
     """Select a concept by its ID to work with (e.g., 'variables', 'loops')."""
-    content = load_content()
     cid = (concept_id or "").strip()
-    match = next((c for c in content if c["id"] == cid), None)
+    match = get_concept(cid)
     if not match:
         return f"Concept '{cid}' not found. Use list_concepts to see IDs."
     ctx.userdata["tutor"]["concept_id"] = cid
-    state = load_state()
-    state["last_concept"] = cid
-    save_state(state)
+    # Keep the resolved concept so the other tools don't need to look it up again
+    ctx.userdata["tutor"]["concept"] = match
+    state = get_state()
+    # Re-selecting the same concept leaves the saved state as it is
+    if state.get("last_concept") != cid:
+        _set_field(state, "last_concept", cid)
+        schedule_save()
     return f"Concept set to: {match.get('title', cid)}"
 
 
@@ -188,17 +368,13 @@ async def explain_concept(ctx: RunContext[dict]):
     cid = ctx.userdata["tutor"].get("concept_id")
     if not cid:
         return "No concept selected. Use set_concept to pick one."
-    content = load_content()
-    match = next((c for c in content if c["id"] == cid), None)
+    match = ctx.userdata["tutor"].get("concept") or get_concept(cid)
     if not match:
         return "Selected concept not found."
     # Mark explained count
-    state = load_state()
-    state.setdefault("mastery", {})
-    ms = state["mastery"].get(cid, {"times_explained": 0, "times_quizzed": 0, "times_taught_back": 0, "last_score": None, "avg_score": None})
-    ms["times_explained"] = ms.get("times_explained", 0) + 1
-    state["mastery"][cid] = ms
-    save_state(state)
+    state = get_state()
+    _bump(state, cid, "times_explained")
+    schedule_save()
     return f"{match.get('title')}: {match.get('summary')}"
 
 @function_tool
@@ -207,11 +383,10 @@ async def get_mcq(ctx: RunContext[dict]):
     cid = ctx.userdata["tutor"].get("concept_id")
     if not cid:
         return {"error": "No concept selected"}
-    content = load_content()
-    match = next((c for c in content if c["id"] == cid), None)
+    match = ctx.userdata["tutor"].get("concept") or get_concept(cid)
     if not match:
         return {"error": "Concept not found"}
-    questions = match.get("quiz", []) or match.get("mcq", [])
+    questions = match["_questions"]
     if not questions:
         return {"error": "No quiz questions for this concept"}
     # maintain rotation index in userdata
@@ -226,13 +401,12 @@ async def evaluate_mcq(ctx: RunContext[dict], user_answer: str):
     cid = ctx.userdata["tutor"].get("concept_id")
     if not cid:
         return {"error": "No concept selected"}
-    content = load_content()
-    match = next((c for c in content if c["id"] == cid), None)
+    match = ctx.userdata["tutor"].get("concept") or get_concept(cid)
     if not match:
         return {"error": "Concept not found"}
     # fetch last asked question index
     idx = (ctx.userdata["tutor"].get("quiz_index", 1) - 1)
-    questions = match.get("quiz", []) or match.get("mcq", [])
+    questions = match["_questions"]
     if not questions:
         return {"error": "No questions"}
     if idx < 0 or idx >= len(questions):
@@ -241,31 +415,26 @@ async def evaluate_mcq(ctx: RunContext[dict], user_answer: str):
     correct_i = q["answer"]
     options = q["options"]
     ua = (user_answer or "").lower().strip()
+    # Tokenize the answer once; the letter, number and overlap checks all work off these
+    ua_toks = _RE_WORD.findall(ua)
 
-    # 1) letter (a/b/c/d)
-    sel = None
-    m = re.search(r"\b([abcd])\b", ua)
-    if m:
-        sel = ord(m.group(1)) - 97
-    else:
-        # number 1-4
-        m2 = re.search(r"\b([1-4])\b", ua)
-        if m2:
-            sel = int(m2.group(1)) - 1
+    # 1) letter (a/b/c/d), else number 1-4, as a standalone word
+    sel = next((ord(t) - 97 for t in ua_toks if t in _LETTER_TOKENS), None)
+    if sel is None:
+        sel = next((int(t) - 1 for t in ua_toks if t in _DIGIT_TOKENS), None)
 
     # 2) match option text
     if sel is None:
-        for i, opt in enumerate(options):
-            if opt.lower() in ua:
+        for i, opt_lower in enumerate(q["_opts_lower"]):
+            if opt_lower in ua:
                 sel = i
                 break
     # 3) partial overlap heuristic
     if sel is None:
-        ua_words = set(re.findall(r"\w+", ua))
+        ua_words = set(ua_toks)
         best_i = None
         best_score = 0
-        for i, opt in enumerate(options):
-            opt_words = set(re.findall(r"\w+", opt.lower()))
+        for i, opt_words in enumerate(q["_opts_wordsets"]):
             common = ua_words & opt_words
             if len(common) > best_score:
                 best_score = len(common)
@@ -275,7 +444,7 @@ async def evaluate_mcq(ctx: RunContext[dict], user_answer: str):
 
     # 4) final fallback check for any keyword from correct option
     if sel is None:
-        for w in re.findall(r"\w+", options[correct_i].lower()):
+        for w in q["_correct_words"]:
             if w in ua:
                 sel = correct_i
                 break
@@ -283,16 +452,10 @@ async def evaluate_mcq(ctx: RunContext[dict], user_answer: str):
     correct = (sel == correct_i)
     feedback = ("Correct — well done!" if correct else f"Not quite. Correct answer: {options[correct_i]}.")
     # update mastery
-    state = load_state()
-    state.setdefault("mastery", {})
-    ms = state["mastery"].get(cid, {"times_explained": 0, "times_quizzed": 0, "times_taught_back": 0, "last_score": None, "avg_score": None})
-    ms["times_quizzed"] = ms.get("times_quizzed", 0) + 1
-    sc = 100 if correct else 0
-    ms["last_score"] = sc
-    prev = ms.get("avg_score")
-    ms["avg_score"] = sc if prev is None else round((prev + sc) / 2, 1)
-    state["mastery"][cid] = ms
-    save_state(state)
+    state = get_state()
+    _bump(state, cid, "times_quizzed")
+    _record_score(state, cid, 100 if correct else 0)
+    schedule_save()
 
     return {"correct": bool(correct), "selected": sel, "correct_index": correct_i, "feedback": feedback}
 
@@ -302,27 +465,21 @@ async def evaluate_teachback(ctx: RunContext[dict], explanation: str):
     cid = ctx.userdata["tutor"].get("concept_id")
     if not cid:
         return {"error": "No concept selected"}
-    content = load_content()
-    match = next((c for c in content if c["id"] == cid), None)
+    match = ctx.userdata["tutor"].get("concept") or get_concept(cid)
     if not match:
         return {"error": "Concept not found"}
-    result = score_explanation(match.get("summary", ""), explanation or "")
+    result = score_explanation(match["_ref_words"], explanation or "")
     # update mastery
-    state = load_state()
-    state.setdefault("mastery", {})
-    ms = state["mastery"].get(cid, {"times_explained": 0, "times_quizzed": 0, "times_taught_back": 0, "last_score": None, "avg_score": None})
-    ms["times_taught_back"] = ms.get("times_taught_back", 0) + 1
-    ms["last_score"] = result["score"]
-    prev = ms.get("avg_score")
-    ms["avg_score"] = result["score"] if prev is None else round((prev + result["score"]) / 2, 1)
-    state["mastery"][cid] = ms
-    save_state(state)
+    state = get_state()
+    _bump(state, cid, "times_taught_back")
+    _record_score(state, cid, result["score"])
+    schedule_save()
     return result
 
 @function_tool
 async def get_mastery_report(ctx: RunContext[dict]):
     """Get a detailed report of the user's mastery progress across all concepts."""
-    state = load_state()
+    state = get_state()
     mastery = state.get("mastery", {})
     if not mastery:
         return "No mastery data yet."
@@ -341,9 +498,10 @@ async def set_mode(ctx: RunContext[dict], mode: str):
         return "Unknown mode. Choose 'learn', 'quiz', or 'teach_back'."
     
     ctx.userdata["tutor"]["mode"] = m
-    state = load_state()
-    state["last_mode"] = m
-    save_state(state)
+    state = get_state()
+    if state.get("last_mode") != m:
+        _set_field(state, "last_mode", m)
+        schedule_save()
     
     # Switch voice based on mode
     voice_map = {
@@ -353,9 +511,9 @@ async def set_mode(ctx: RunContext[dict], mode: str):
     }
     
     new_voice = voice_map.get(m, VOICE_LEARN)
-    session_ref = ctx.userdata.get('_session_ref')
-    if session_ref:
-        switch_session_voice(session_ref, new_voice)
+    tts_targets = ctx.userdata.get('_tts_targets')
+    if tts_targets:
+        switch_session_voice(tts_targets, ctx.userdata["_tts_pool"], new_voice)
     
     return f"Mode set to: {m}. Voice switched to {new_voice}."
 
@@ -433,11 +591,16 @@ async def entrypoint(ctx: JobContext):
     if not content:
         logger.error("No content loaded. Please add day4_tutor_content.json")
 
+    # Per-session TTS instances for the three mode voices
+    tts_pool = build_tts_pool()
+
     # Initialize user data
     userdata = {
+        "_tts_pool": tts_pool,
         "tutor": {
             "mode": None,
             "concept_id": None,
+            "concept": None,
             "quiz_index": 0,
         },
         "history": []
@@ -447,7 +610,7 @@ async def entrypoint(ctx: JobContext):
     session = AgentSession(
         stt=deepgram.STT(model="nova-3"),
         llm=google.LLM(model="gemini-2.5-flash", api_key=os.getenv("GOOGLE_API_KEY")),
-        tts=murf.TTS(voice=VOICE_LEARN, style="Conversation", text_pacing=True),
+        tts=tts_pool[VOICE_LEARN],
         turn_detection=MultilingualModel(),
         vad=ctx.proc.userdata.get("vad"),
         userdata=userdata,
@@ -466,9 +629,12 @@ async def entrypoint(ctx: JobContext):
         )
     )
 
-    # Pass session reference for voice switching
+    # Pass session reference for voice switching; the TTS attributes are resolved once here
     agent._session = session
-    session.userdata['_session_ref'] = session
+    session.userdata['_tts_targets'] = resolve_tts_targets(session)
+
+    # Don't lose a pending mastery update when the job ends
+    ctx.add_shutdown_callback(flush_state)
 
     # Connect to room
     await ctx.connect()
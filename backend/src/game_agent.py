@@ -1,9 +1,8 @@
 import os
 import json
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from pathlib import Path
-import asyncio
 import uuid
 from datetime import datetime
 
@@ -24,6 +23,8 @@ from livekit.agents import (
 from livekit.plugins import google, murf, deepgram, silero
 from livekit.plugins.turn_detector.multilingual import MultilingualModel
 
+import json_utils
+
 load_dotenv(".env.local")
 logger = logging.getLogger("gamemaster.agent")
 
@@ -58,6 +59,10 @@ INITIAL_GAME_STATE = {
     }
 }
 
+# Serialized once so every reset gets a fresh deep copy; a plain .copy() would share
+# the nested dicts/lists with the template above.
+_INITIAL_STATE_JSON = json_utils.dumps_bytes(INITIAL_GAME_STATE)
+
 
 # --- Game Master Logic Class (Replaces GroceryAgentLogic) ---
 
@@ -65,14 +70,17 @@ class GameMasterLogic:
     """Manages the current game state for the RPG."""
     def __init__(self):
         # The game state is reset to the initial state on startup or manual reset
-        self.game_state = INITIAL_GAME_STATE.copy()
+        self.game_state = json_utils.loads(_INITIAL_STATE_JSON)
+        # JSON form of game_state, built lazily and dropped whenever the state changes
+        self._serialized: Optional[bytes] = _INITIAL_STATE_JSON
         logger.info("GameMasterLogic initialized with Eren in The Glitchlands.")
 
     def update_state(self, new_state_json: str) -> bool:
         """Called by the tool to update the internal state based on LLM output."""
         try:
-            new_state = json.loads(new_state_json)
+            new_state = json_utils.loads(new_state_json)
             self.game_state = new_state
+            self._serialized = None
             logger.info(f"Game State successfully updated. Turn: {new_state['turn_number']}")
             # Optionally save to disk for true persistence (optional for Day 8)
             # with open(GAME_STATE_PATH, 'w', encoding='utf-8') as f:
@@ -86,9 +94,16 @@ class GameMasterLogic:
         """Returns the current state to be passed to the LLM."""
         return self.game_state
 
+    def serialized_state(self) -> str:
+        """Returns the current state as JSON, serializing it only once per change."""
+        if self._serialized is None:
+            self._serialized = json_utils.dumps_bytes(self.game_state)
+        return self._serialized.decode()
+
     def reset_story(self):
         """Resets the game state to the starting conditions."""
-        self.game_state = INITIAL_GAME_STATE.copy()
+        self.game_state = json_utils.loads(_INITIAL_STATE_JSON)
+        self._serialized = _INITIAL_STATE_JSON
         logger.info("Game story reset.")
 
 
@@ -118,15 +133,15 @@ async def process_player_action_tool(
         player_action_description: A summary of the player's move (e.g., 'Eren moves into the Undercroft').
         new_game_state_json: The FULL, UPDATED JSON string of the game state.
     """
-    success = await asyncio.to_thread(GM_LOGIC.update_state, new_game_state_json)
+    # Parsing a small JSON blob is cheaper than a thread-pool hop, so do it inline
+    success = GM_LOGIC.update_state(new_game_state_json)
     
     # The LLM will use this return value to formulate its next narrative.
     # We return the new state and the narrative prompt.
     if success:
-        current_state = GM_LOGIC.get_current_state()
         return f"""
         GM: The persistent state has been updated successfully. 
-        Current State: {json.dumps(current_state)}.
+        Current State: {GM_LOGIC.serialized_state()}.
         Based on this, generate the next scene description and end with a clear prompt for Eren's next action. 
         """
     else:
@@ -139,20 +154,18 @@ async def restart_story_tool(ctx: RunContext[None]) -> str:
     Resets the entire game to the starting conditions. 
     Use this when the player explicitly asks to 'Restart' or 'Start over'.
     """
-    await asyncio.to_thread(GM_LOGIC.reset_story)
+    GM_LOGIC.reset_story()
     # The LLM will use this to generate the very first scene description.
-    return f"GM: The story has been reset. The initial game state is: {json.dumps(GM_LOGIC.get_current_state())}. Begin the narrative from the starting scene."
+    return f"GM: The story has been reset. The initial game state is: {GM_LOGIC.serialized_state()}. Begin the narrative from the starting scene."
 
 
 # --- The LiveKit Assistant Class (Rewritten for Game Master) ---
 
-class Assistant(Agent):
-    def __init__(self) -> None:
-        # Get the initial game state to inject into the instructions
-        initial_state_json = json.dumps(GM_LOGIC.get_current_state(), indent=2)
-        
-        super().__init__(
-            instructions=f"""
+# The GM prompt only embeds the *initial* state, so render it once at import. Every
+# session then sends a byte-identical system prefix, which Gemini 2.5's implicit
+# context caching can reuse instead of re-processing it on each request.
+_INITIAL_STATE_PRETTY = json_utils.dumps(INITIAL_GAME_STATE, indent=True)
+GM_INSTRUCTIONS = f"""
             **You are the Game Master (GM) running a D&D-style, single-player adventure.**
             
             **Universe:** Post-Apocalyptic Cyber-Wasteland ('The Glitchlands') with Attack on Titan themes.
@@ -167,19 +180,26 @@ class Assistant(Agent):
             5. **Use the Tool:** After the player's action, you MUST mentally calculate the outcome, update the provided initial JSON state accordingly, and call the `process_player_action_tool` with the updated JSON state.
             
             **Initial Game State (JSON):**
-            {initial_state_json}
-            """,
+            {_INITIAL_STATE_PRETTY}
+            """
+
+class Assistant(Agent):
+    def __init__(self) -> None:
+        super().__init__(
+            instructions=GM_INSTRUCTIONS,
             tools=[process_player_action_tool, restart_story_tool]
         )
 
 def prewarm(proc: JobProcess):
     proc.userdata["vad"] = silero.VAD.load()
+    # Shared Gemini client: every job on this worker reuses its connection pool
+    proc.userdata["llm"] = google.LLM(model="gemini-2.5-flash", api_key=os.getenv("GOOGLE_API_KEY"))
 
 async def entrypoint(ctx: JobContext):
     # Initialize the LLM, STT, and TTS components
     session = AgentSession(
         stt=deepgram.STT(model="nova-3"),
-        llm=google.LLM(model="gemini-2.5-flash", api_key=os.getenv("GOOGLE_API_KEY")),
+        llm=ctx.proc.userdata["llm"],
         # Use a dramatic voice for the GM
         tts=murf.TTS(voice="en-US-matthew", style="Dramatic", text_pacing=True), 
         turn_detection=MultilingualModel(),
@@ -187,7 +207,8 @@ async def entrypoint(ctx: JobContext):
         preemptive_generation=True,
     )
 
-    # Start the session, passing the Assistant agent with its tools and instructions
+    # Start the session, passing the Assistant agent with its tools and instructions.
+    # This also warms up the provider connections, so keep it ahead of ctx.connect().
     await session.start(
         agent=Assistant(),
         room=ctx.room,
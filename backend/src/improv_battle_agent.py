@@ -1,6 +1,7 @@
 import os
 import json
 import logging
+import re
 from typing import Dict, Any, List
 from pathlib import Path
 import asyncio
@@ -24,6 +25,8 @@ from livekit.agents import (
 from livekit.plugins import google, murf, deepgram, silero
 from livekit.plugins.turn_detector.multilingual import MultilingualModel
 
+import json_utils
+
 load_dotenv(".env.local")
 logger = logging.getLogger("improv.agent")
 
@@ -41,6 +44,12 @@ SCENARIOS: List[str] = [
     "You are an overzealous real estate agent trying to sell an apartment where the only window looks directly into the mouth of a massive, roaring T-Rex statue."
 ]
 
+# Rendered once as a compact bullet list for the system prompt (instead of the list's repr)
+SCENARIOS_BLOCK = "\n".join(f"- {s}" for s in SCENARIOS)
+
+# Early-exit phrases, matched case-insensitively in a single pass over the utterance
+EXIT_RE = re.compile(r"\b(?:stop game|end show|i'?m done)\b", re.IGNORECASE)
+
 # --- Game State Management Logic ---
 
 def get_initial_state() -> Dict[str, Any]:
@@ -56,11 +65,9 @@ def get_initial_state() -> Dict[str, Any]:
 
 # --- The LiveKit Improv Host Class (LLM Logic) ---
 
-class ImprovBattleHost(Agent):
-    def __init__(self) -> None:
-        super().__init__(
-            # The system prompt is the most critical part for persona and flow control.
-            instructions=f"""You are **Jax Stellar**, the high-energy, witty, and charismatic host of the TV improv show, **'Improv Battle'**.
+# The system prompt is the most critical part for persona and flow control.
+# Built once at import; every host instance shares the same string.
+INSTRUCTIONS_TEMPLATE = f"""You are **Jax Stellar**, the high-energy, witty, and charismatic host of the TV improv show, **'Improv Battle'**.
             
             ***PERSONA & TONE:***
             Your energy must be consistently high. Be clear about the rules and the scenarios. Your reactions must be **varied and realistic**: sometimes amused, sometimes unimpressed, sometimes pleasantly surprised. You are allowed to use **light teasing and honest, constructive critique**, but you must always remain respectful and non-abusive. You must randomly cycle between supportive, neutral, and mildly critical tones for your reactions.
@@ -74,11 +81,16 @@ class ImprovBattleHost(Agent):
             5. **phase: done**: Deliver a short summary of the player's overall performance, mentioning specific moments. Thank them and end the session gracefully.
 
             ***SCENARIOS (For reference/inspiration - Pick one for each round):***
-            {SCENARIOS}
+            {SCENARIOS_BLOCK}
             
             ***EARLY EXIT:***
             If the user says 'stop game', 'end show', or 'I'm done', immediately transition to the 'done' phase for a graceful exit.
-            """,
+            """
+
+class ImprovBattleHost(Agent):
+    def __init__(self) -> None:
+        super().__init__(
+            instructions=INSTRUCTIONS_TEMPLATE,
             tools=[] # No tools are needed; the logic relies on state and LLM intelligence
         )
 
@@ -90,108 +102,124 @@ class ImprovBattleHost(Agent):
         """Saves the game state back to session data."""
         ctx.session.session_data['improv_state'] = state
 
+    async def _persist_game_state(self, ctx: ChatContext, state: Dict[str, Any]):
+        """Awaitable hook for state persistence, so it can overlap with TTS playback."""
+        self._update_game_state(ctx, state)
+
     async def run(self, ctx: ChatContext):
         state = self._get_game_state(ctx)
+        text = ctx.transcription.text
 
-        # 1. INITIAL GREETING (PHASE: intro)
-        if state["phase"] == "intro":
-            greeting = "Welcome, contestants, to 'Improv Battle'! I'm your host, Jax Stellar. This is where we separate the comedy gold from the cold custard! Who do I have the pleasure of challenging tonight? What is your stage name?"
-            await ctx.session.say(greeting)
-            state["phase"] = "awaiting_name"
-            self._update_game_state(ctx, state)
-            return
-
-        # 2. MAIN GAME LOOP (Handles logic after every user turn)
-        
-        # Check for Early Exit
-        if "stop game" in ctx.transcription.text.lower() or "end show" in ctx.transcription.text.lower():
+        # Check for Early Exit (the intro greeting always plays first)
+        if state["phase"] != "intro" and EXIT_RE.search(text):
             state["phase"] = "done"
-            # Fall through to the final phase
 
-        # 2.1. Awaiting Name (PHASE: awaiting_name)
-        if state["phase"] == "awaiting_name":
-            # Simple heuristic to grab the first word/phrase as a name
-            player_input = ctx.transcription.text.strip()
-            state["player_name"] = player_input.split()[0].title() if player_input else "Contestant"
-            
-            rules_text = (
-                f"Alright, **{state['player_name']}**! The rules are simple: I give you a scenario, and you give me comedy gold. "
-                f"We're running {state['max_rounds']} rounds. When you're done with a scene, just pause or say 'End scene.' "
-                f"Are you ready for Round 1?"
-            )
-            await ctx.session.say(rules_text)
-            
-            state["phase"] = "awaiting_improv"
-            self._update_game_state(ctx, state)
-            # Re-run the loop to immediately start Round 1
-            await self.run(ctx)
-            return
-
-        # 2.2. Reaction / Next Round Logic (PHASE: reacting)
-        elif state["phase"] == "reacting":
-            
-            # The user's last turn was the improv performance
-            performance = ctx.transcription.text
+        # Phases that chain into one another (name -> first scene, reaction -> next scene
+        # or finale) loop here instead of recursing; the loop breaks when it needs user input,
+        # leaving the last line to speak in closing_line.
+        closing_line = None
+        while True:
+            phase = state["phase"]
+
+            # 1. INITIAL GREETING (PHASE: intro)
+            if phase == "intro":
+                greeting = "Welcome, contestants, to 'Improv Battle'! I'm your host, Jax Stellar. This is where we separate the comedy gold from the cold custard! Who do I have the pleasure of challenging tonight? What is your stage name?"
+                state["phase"] = "awaiting_name"
+                closing_line = greeting
+                break
+
+            # 2. MAIN GAME LOOP (Handles logic after every user turn)
+
+            # 2.1. Awaiting Name (PHASE: awaiting_name)
+            elif phase == "awaiting_name":
+                # Simple heuristic to grab the first word/phrase as a name
+                player_input = text.strip()
+                state["player_name"] = player_input.split()[0].title() if player_input else "Contestant"
+                
+                rules_text = (
+                    f"Alright, **{state['player_name']}**! The rules are simple: I give you a scenario, and you give me comedy gold. "
+                    f"We're running {state['max_rounds']} rounds. When you're done with a scene, just pause or say 'End scene.' "
+                    f"Are you ready for Round 1?"
+                )
+                await ctx.session.say(rules_text)
+                
+                # Continue straight into Round 1
+                state["phase"] = "awaiting_improv"
+
+            # 2.2. Reaction / Next Round Logic (PHASE: reacting)
+            elif phase == "reacting":
+                
+                # The user's last turn was the improv performance
+                performance = text
+
+                # Update the last round with the performance for the LLM to react to
+                current_round_data = state["rounds"][-1]
+                current_round_data["performance"] = performance
+
+                # Generate the host reaction using a directed prompt
+                reaction_prompt = f"React to the performance from **{state['player_name']}**. The performance was: '{performance}'. Use your Jax Stellar persona, choose a tone (supportive, critical, or neutral), and make it brief and witty."
+                
+                # Use an LLM node for the reaction
+                reaction = await ctx.session.llm.say(reaction_prompt)
+                await ctx.session.say(reaction)
+                
+                current_round_data["host_reaction"] = reaction # Save the reaction
+
+                # Determine next step (either next improv or done)
+                if state["current_round"] >= state["max_rounds"]:
+                    state["phase"] = "done"
+                else:
+                    state["current_round"] += 1
+                    state["phase"] = "awaiting_improv" 
+
+            # 2.3. Starting Improv (PHASE: awaiting_improv)
+            elif phase == "awaiting_improv":
+                round_idx = state["current_round"] - 1 # Use 0-based index for SCENARIOS list
+                
+                # Ensure we don't run out of scenarios, cycling if necessary
+                scenario = SCENARIOS[round_idx % len(SCENARIOS)]
+                
+                scene_prompt = (
+                    f"This is Round **{state['current_round']}**! **{state['player_name']}**, your scenario is: **{scenario}**! "
+                    f"I want to see character, commitment, and chaos! The spotlight is on you! BEGIN!"
+                )
+                # Prepare state for reaction phase
+                if len(state["rounds"]) < state["current_round"]:
+                    state["rounds"].append({"scenario": scenario})
+
+                state["phase"] = "reacting"
+                closing_line = scene_prompt
+                break
+                
+            # 3. FINALE (PHASE: done)
+            elif phase == "done":
+                # Generate the final summary using a directed prompt
+                rounds_json = json_utils.dumps(state["rounds"])
+                summary_prompt = (
+                    f"The battle is over! Deliver a final summary for **{state['player_name']}**. "
+                    f"Based on their performance in the following rounds: {rounds_json}. "
+                    f"Summarize what kind of improviser they seemed to be (e.g., strong character, loves absurdity, emotional range). "
+                    f"Thank them and close the show with flair. Be concise but dramatic."
+                )
+                
+                final_summary = await ctx.session.llm.say(summary_prompt)
+                await ctx.session.say(final_summary)
+                
+                # End the session gracefully
+                await ctx.session.end_session()
+                return
 
-            # Update the last round with the performance for the LLM to react to
-            current_round_data = state["rounds"][-1]
-            current_round_data["performance"] = performance
-
-            # Generate the host reaction using a directed prompt
-            reaction_prompt = f"React to the performance from **{state['player_name']}**. The performance was: '{performance}'. Use your Jax Stellar persona, choose a tone (supportive, critical, or neutral), and make it brief and witty."
-            
-            # Use an LLM node for the reaction
-            reaction = await ctx.session.llm.say(reaction_prompt)
-            await ctx.session.say(reaction)
-            
-            current_round_data["host_reaction"] = reaction # Save the reaction
-
-            # Determine next step
-            if state["current_round"] >= state["max_rounds"]:
-                state["phase"] = "done"
             else:
-                state["current_round"] += 1
-                state["phase"] = "awaiting_improv" 
-            
-            self._update_game_state(ctx, state)
-            # Fall through to the next phase logic (either next improv or done)
-
-        # 2.3. Starting Improv (PHASE: awaiting_improv)
-        if state["phase"] == "awaiting_improv":
-            round_idx = state["current_round"] - 1 # Use 0-based index for SCENARIOS list
-            
-            # Ensure we don't run out of scenarios, cycling if necessary
-            scenario = SCENARIOS[round_idx % len(SCENARIOS)]
-            
-            scene_prompt = (
-                f"This is Round **{state['current_round']}**! **{state['player_name']}**, your scenario is: **{scenario}**! "
-                f"I want to see character, commitment, and chaos! The spotlight is on you! BEGIN!"
+                break
+
+        # Single state write per turn, overlapped with the TTS request for the closing line
+        if closing_line is None:
+            await self._persist_game_state(ctx, state)
+        else:
+            await asyncio.gather(
+                ctx.session.say(closing_line),
+                self._persist_game_state(ctx, state),
             )
-            await ctx.session.say(scene_prompt)
-            
-            # Prepare state for reaction phase
-            if len(state["rounds"]) < state["current_round"]:
-                state["rounds"].append({"scenario": scenario})
-
-            state["phase"] = "reacting"
-            self._update_game_state(ctx, state)
-            return
-            
-        # 3. FINALE (PHASE: done)
-        if state["phase"] == "done":
-            # Generate the final summary using a directed prompt
-            summary_prompt = (
-                f"The battle is over! Deliver a final summary for **{state['player_name']}**. "
-                f"Based on their performance in the following rounds: {state['rounds']}. "
-                f"Summarize what kind of improviser they seemed to be (e.g., strong character, loves absurdity, emotional range). "
-                f"Thank them and close the show with flair. Be concise but dramatic."
-            )
-            
-            final_summary = await ctx.session.llm.say(summary_prompt)
-            await ctx.session.say(final_summary)
-            
-            # End the session gracefully
-            await ctx.session.end_session()
 
 
 # --- LiveKit Boilerplate for Execution ---
@@ -202,19 +230,22 @@ def prewarm(proc: JobProcess):
     except Exception as e:
         logger.error(f"Failed to load VAD model: {e}")
         proc.userdata["vad"] = None
+    # One Gemini client per worker process, reused by every session it hosts so they
+    # share its connection pool instead of each opening their own
+    proc.userdata["llm"] = google.LLM(model="gemini-2.5-flash", api_key=os.getenv("GOOGLE_API_KEY"))
 
 async def entrypoint(ctx: JobContext):
     # Initialize the LLM, STT, and TTS components
     session = AgentSession(
         stt=deepgram.STT(model="nova-3"),
-        llm=google.LLM(model="gemini-2.5-flash", api_key=os.getenv("GOOGLE_API_KEY")), 
+        llm=ctx.proc.userdata["llm"], 
         tts=murf.TTS(voice="en-US-matthew", style="Conversation", text_pacing=True),
         turn_detection=MultilingualModel(),
         vad=ctx.proc.userdata.get("vad"),
         preemptive_generation=True,
     )
 
-    # Start the session
+    # Start the session, which initializes the voice pipeline and warms up the models
     await session.start(
         agent=ImprovBattleHost(),
         room=ctx.room,
@@ -0,0 +1,49 @@
+import json
+from typing import Any
+
+# orjson is a much faster C encoder/decoder, but it is not a locked dependency of
+# this project, so fall back to the stdlib when it isn't installed.
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, and the stdlib path below
+# re-raises invalid UTF-8 as one too, so callers only ever need to catch this.
+JSONDecodeError = json.JSONDecodeError
+
+
+def dumps_bytes(obj: Any, *, indent: bool = False, newline: bool = False) -> bytes:
+    """Serializes obj to UTF-8 JSON bytes (2-space indented if requested)."""
+    if orjson is not None:
+        option = 0
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if newline:
+            option |= orjson.OPT_APPEND_NEWLINE
+        return orjson.dumps(obj, option=option)
+
+    if indent:
+        text = json.dumps(obj, indent=2, ensure_ascii=False)
+    else:
+        text = json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+    if newline:
+        text += "\n"
+    return text.encode("utf-8")
+
+
+def dumps(obj: Any, *, indent: bool = False) -> str:
+    """Serializes obj to a JSON string (2-space indented if requested)."""
+    return dumps_bytes(obj, indent=indent).decode("utf-8")
+
+
+def loads(data: Any) -> Any:
+    """Parses JSON from str or bytes; malformed input always raises JSONDecodeError."""
+    if orjson is not None:
+        return orjson.loads(data)
+    try:
+        return json.loads(data)
+    except UnicodeDecodeError as e:
+        # json.loads(bytes) decodes before parsing, and that error isn't a JSONDecodeError
+        doc = data.decode("utf-8", "replace")
+        raise JSONDecodeError(f"Invalid UTF-8: {e.reason}", doc, e.start) from e
@@ -1,9 +1,11 @@
 import os
-import json
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from pathlib import Path
 import asyncio
+import bisect
+import functools
+import re
 import uuid
 from datetime import datetime
 
@@ -25,6 +27,8 @@ from livekit.agents import (
 from livekit.plugins import google, murf, deepgram, silero
 from livekit.plugins.turn_detector.multilingual import MultilingualModel
 
+import json_utils
+
 load_dotenv(".env.local")
 logger = logging.getLogger("grocery.agent")
 
@@ -32,58 +36,193 @@ logger = logging.getLogger("grocery.agent")
 # Calculates the path to the catalog.json based on your directory structure
 CATALOG_PATH = Path(__file__).parent.parent.joinpath('DAY-7', 'catalog.json')
 ORDERS_DIR = Path(__file__).parent.parent.joinpath('DAY-7', 'orders')
-ORDERS_DIR.mkdir(exist_ok=True) # Ensure the 'orders' directory exists
+
+def format_money(paise: int) -> str:
+    """Paise amount as rupees spoken/shown to the user, e.g. 12050 -> ₹120.50."""
+    return f"₹{paise / 100:.2f}"
+
+
+# Punctuation speech-to-text attaches to words ("egg curry.", "pasta?")
+_RE_PUNCT = re.compile(r"[^\w\s]")
+
+
+# --- Order File Writer ---
+# place_order_and_save only serializes the order and queues (path, bytes); a single
+# background task per job writes the files, so the tool reply doesn't wait on disk.
+
+
+@functools.lru_cache(maxsize=1)
+def _ensure_orders_dir() -> Path:
+    # Created on the first order rather than at import; cached so it is one mkdir per process
+    ORDERS_DIR.mkdir(exist_ok=True)
+    return ORDERS_DIR
+
+
+def write_order_file(path: Path, blob: bytes):
+    _ensure_orders_dir()
+    path.write_bytes(blob)
+
+
+async def order_writer(queue: asyncio.Queue):
+    """Writes queued order files one at a time."""
+    while True:
+        path, blob = await queue.get()
+        try:
+            await asyncio.to_thread(write_order_file, path, blob)
+        except Exception as e:
+            logger.error(f"Error saving order {path.name}: {e}")
+        finally:
+            queue.task_done()
+
+
+# Hard-coded recipe map for intelligent ordering; built once at import and shared by every session
+_RECIPES: Dict[str, List[Dict[str, Any]]] = {
+    "peanut butter sandwich": [
+        {"name": "whole wheat bread", "quantity": 1}, 
+        {"name": "peanut butter (crunchy)", "quantity": 1}
+    ],
+    "simple pasta dinner": [
+        {"name": "dried spaghetti pasta", "quantity": 1}, 
+        {"name": "tomato pasta sauce (marinara)", "quantity": 1}, 
+        {"name": "tomato", "quantity": 0.5} # 0.5 kg Tomatoes
+    ],
+    "egg curry": [
+        {"name": "white eggs (pack of 12)", "quantity": 1}, 
+        {"name": "onion", "quantity": 0.5},
+        {"name": "turmeric powder (haldi)", "quantity": 1}
+    ]
+}
+
+
+# --- Cart Line ---
+
+class CartLine:
+    """One cart entry. Slotted since a cart holds one per distinct item; amounts are paise."""
+    __slots__ = ("id", "line_total_paise", "name", "price_paise", "quantity_ordered", "unit")
+
+    def __init__(self, catalog_item: Dict[str, Any], quantity: float):
+        self.id = catalog_item['id']
+        self.name = catalog_item['name']
+        self.price_paise = catalog_item['price_paise']
+        self.unit = catalog_item['unit']
+        self.line_total_paise = 0
+        self.set_quantity(quantity)
+
+    def set_quantity(self, quantity: float) -> int:
+        """Sets the quantity and line total; returns the change in line total (paise)."""
+        old_total = self.line_total_paise
+        self.quantity_ordered = quantity
+        self.line_total_paise = round(self.price_paise * quantity)
+        return self.line_total_paise - old_total
+
+    def to_order_dict(self) -> Dict[str, Any]:
+        """Cart line as saved in an order file, with amounts in rupees."""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "price_per_unit": self.price_paise / 100,
+            "quantity_ordered": self.quantity_ordered,
+            "unit": self.unit,
+            "line_total": self.line_total_paise / 100
+        }
+
 
 # --- Grocery Agent Logic Class ---
 
 class GroceryAgentLogic:
     """Manages the catalog, cart state, and order persistence."""
-    def __init__(self):
-        self.catalog = self._load_catalog()
-        self.cart = {"items": [], "subtotal": 0.00}
-        self.recipes = self._get_recipe_map()
-        logger.info(f"Catalog loaded successfully with {len(self.catalog)} items.")
-
-    def _load_catalog(self) -> Dict[str, Any]:
+    def __init__(self, catalog: Optional[Dict[str, Any]] = None, order_queue: Optional[asyncio.Queue] = None):
+        # Share the catalog parsed in prewarm when given one; only parse it here as a fallback
+        self.catalog = catalog if catalog is not None else self.load_catalog()
+        # The job's order writer queue; without one, orders are written directly
+        self.order_queue = order_queue
+        # Cart lines keyed by lowercased item name; subtotal is kept in step with every change.
+        # All cart money is integer paise; rupees only appear when formatting or saving an order.
+        self.cart = {"items": {}, "subtotal_paise": 0}
+        self.recipes = _RECIPES
+        self._build_name_index()
+        self._recipe_lines = self._resolve_recipes()
+        # Longest first, so "ingredients for a simple pasta dinner" resolves to the most specific recipe
+        self._recipe_keys = sorted(self.recipes, key=len, reverse=True)
+
+    @staticmethod
+    def load_catalog() -> Dict[str, Any]:
         """Loads and flattens the catalog.json."""
         try:
-            with open(CATALOG_PATH, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = json_utils.loads(CATALOG_PATH.read_bytes())
             flat_catalog = {}
             for category, items in data.items():
                 for item in items:
                     # Use lowercased name for case-insensitive matching
                     flat_catalog[item['name'].lower()] = item
+                    item['price_paise'] = round(item['price'] * 100)
+            logger.info(f"Catalog loaded successfully with {len(flat_catalog)} items.")
             return flat_catalog
         except FileNotFoundError:
             logger.error(f"FATAL: Catalog file not found at {CATALOG_PATH}")
             return {}
-        except json.JSONDecodeError:
+        except json_utils.JSONDecodeError:
             logger.exception("FATAL: Invalid JSON format in catalog.json")
             return {}
 
-    def _get_recipe_map(self) -> Dict[str, List[Dict[str, Any]]]:
-        """Hard-coded recipe map for intelligent ordering."""
-        return {
-            "peanut butter sandwich": [
-                {"name": "whole wheat bread", "quantity": 1}, 
-                {"name": "peanut butter (crunchy)", "quantity": 1}
-            ],
-            "simple pasta dinner": [
-                {"name": "dried spaghetti pasta", "quantity": 1}, 
-                {"name": "tomato pasta sauce (marinara)", "quantity": 1}, 
-                {"name": "tomato", "quantity": 0.5} # 0.5 kg Tomatoes
-            ],
-            "egg curry": [
-                {"name": "white eggs (pack of 12)", "quantity": 1}, 
-                {"name": "onion", "quantity": 0.5},
-                {"name": "turmeric powder (haldi)", "quantity": 1}
-            ]
-        }
-
-    def _update_cart_total(self):
-        """Recalculates the cart subtotal."""
-        self.cart['subtotal'] = round(sum(item['line_total'] for item in self.cart['items']), 2)
+    def _build_name_index(self):
+        """Joins the lowercased catalog names into one newline-separated string for partial matching."""
+        self._names = list(self.catalog)
+        self._name_offsets = []
+        pos = 0
+        for name in self._names:
+            self._name_offsets.append(pos)
+            pos += len(name) + 1
+        self._names_blob = "\n".join(self._names)
+
+    def _find_partial_match(self, query: str) -> Optional[Dict[str, Any]]:
+        """First catalog item (in catalog order) whose lowercased name contains query."""
+        if "\n" in query:
+            return None
+        pos = self._names_blob.find(query)
+        if pos < 0:
+            return None
+        return self.catalog[self._names[bisect.bisect_right(self._name_offsets, pos) - 1]]
+
+    def _resolve_recipes(self) -> Dict[str, List[tuple]]:
+        """Resolves every recipe ingredient against the catalog once: (cart key, catalog item, quantity, display name)."""
+        resolved = {}
+        for recipe, ingredients in self.recipes.items():
+            lines = []
+            for ingredient in ingredients:
+                key = ingredient['name'].lower()
+                catalog_item = self.catalog.get(key)
+                if catalog_item:
+                    lines.append((key, catalog_item, ingredient['quantity'], ingredient['name'].title()))
+            resolved[recipe] = lines
+        return resolved
+
+    def _match_recipe(self, phrase: str) -> Optional[str]:
+        """Recipe key for a loosely phrased request: longest key inside the phrase, else the one key containing it."""
+        # Strip punctuation, then pad with spaces so only whole words match
+        # ("eg" must not hit "egg curry")
+        padded = f" {' '.join(_RE_PUNCT.sub(' ', phrase).split())} "
+        for key in self._recipe_keys:
+            if f" {key} " in padded:
+                return key
+        # e.g. "pasta dinner" -> "simple pasta dinner"; only accept it when it's unambiguous
+        containing = [key for key in self._recipe_keys if padded in f" {key} "]
+        return containing[0] if len(containing) == 1 else None
+
+    def _add_line(self, key: str, catalog_item: Dict[str, Any], quantity: float) -> bool:
+        """Adds quantity of a catalog item to the cart. Returns True if it merged into an existing line."""
+        item = self.cart['items'].get(key)
+        if item:
+            self._adjust_subtotal(item.set_quantity(item.quantity_ordered + quantity))
+            return True
+
+        item = self.cart['items'][key] = CartLine(catalog_item, quantity)
+        self._adjust_subtotal(item.line_total_paise)
+        return False
+
+    def _adjust_subtotal(self, delta_paise: int):
+        """Applies a line total change (in paise) to the running cart subtotal."""
+        self.cart['subtotal_paise'] += delta_paise
 
     def add_item_to_cart(self, item_name: str, quantity: float) -> str:
         """Adds a single item to the cart or updates quantity."""
@@ -91,90 +230,77 @@ class GroceryAgentLogic:
         catalog_item = self.catalog.get(item_name_lower)
         
         if not catalog_item:
-            # Check for partial match (optional, but helpful)
-            for name, item in self.catalog.items():
-                if item_name_lower in name:
-                    return f"❌ Did you mean {item['name']}? Please specify the exact item name."
+            # Check for partial match (optional, but helpful): one str.find over all names
+            item = self._find_partial_match(item_name_lower)
+            if item:
+                return f"❌ Did you mean {item['name']}? Please specify the exact item name."
             return f"❌ Sorry, I couldn't find '{item_name}'. Can you be more specific? For example, say the brand or size."
 
-        price_per_unit = catalog_item['price']
-        line_total = round(price_per_unit * quantity, 2)
-        
-        # Check if item is already in cart
-        for item in self.cart['items']:
-            if item['name'].lower() == item_name_lower:
-                item['quantity_ordered'] += quantity
-                item['line_total'] = round(item['price_per_unit'] * item['quantity_ordered'], 2)
-                self._update_cart_total()
-                return f"✅ Updated cart. Added {quantity} more {catalog_item['unit']} of {item_name}. You now have {item['quantity_ordered']} in total. Your subtotal is ₹{self.cart['subtotal']:.2f}."
-
-        # Add new item
-        new_item = {
-            "id": catalog_item['id'],
-            "name": catalog_item['name'],
-            "price_per_unit": price_per_unit,
-            "quantity_ordered": quantity,
-            "unit": catalog_item['unit'],
-            "line_total": line_total
-        }
-        self.cart['items'].append(new_item)
-        self._update_cart_total()
-        
-        return f"✅ Added {quantity} {catalog_item['unit']} of {catalog_item['name']} (₹{line_total:.2f}) to your cart. Current subtotal: ₹{self.cart['subtotal']:.2f}."
+        # Merge into the existing line if the item is already in the cart
+        merged = self._add_line(item_name_lower, catalog_item, quantity)
+        item = self.cart['items'][item_name_lower]
+        if merged:
+            return f"✅ Updated cart. Added {quantity} more {catalog_item['unit']} of {item_name}. You now have {item.quantity_ordered} in total. Your subtotal is {format_money(self.cart['subtotal_paise'])}."
+
+        return f"✅ Added {quantity} {catalog_item['unit']} of {catalog_item['name']} ({format_money(item.line_total_paise)}) to your cart. Current subtotal: {format_money(self.cart['subtotal_paise'])}."
 
     def add_recipe_to_cart(self, recipe_phrase: str) -> str:
         """Handles the intelligent 'ingredients for X' request."""
         recipe_phrase_lower = recipe_phrase.lower().strip()
-        recipe_items = self.recipes.get(recipe_phrase_lower)
+        recipe_lines = self._recipe_lines.get(recipe_phrase_lower)
+        if recipe_lines is None and recipe_phrase_lower:
+            # The LLM didn't use the exact recipe name; try a loose match before giving up
+            recipe_key = self._match_recipe(recipe_phrase_lower)
+            if recipe_key is not None:
+                recipe_phrase = recipe_key
+                recipe_lines = self._recipe_lines[recipe_key]
         
-        if not recipe_items:
+        if recipe_lines is None:
             return f"🤔 I don't have a known recipe for '{recipe_phrase}'. I can only handle simple recipes like 'simple pasta dinner' or 'egg curry'."
 
+        # Ingredients were resolved against the catalog up front; just apply them
         added_names = []
-        for item in recipe_items:
-            # Recursively call the single item function
-            response = self.add_item_to_cart(item['name'], item['quantity'])
-            if response.startswith("✅"):
-                added_names.append(item['name'].title())
+        for key, catalog_item, quantity, display_name in recipe_lines:
+            self._add_line(key, catalog_item, quantity)
+            added_names.append(display_name)
 
         if added_names:
             names_list = ', '.join(added_names)
-            return f"🎉 For your {recipe_phrase.title()}, I have added: {names_list} to the cart. Your new subtotal is ₹{self.cart['subtotal']:.2f}. Anything else?"
+            return f"🎉 For your {recipe_phrase.title()}, I have added: {names_list} to the cart. Your new subtotal is {format_money(self.cart['subtotal_paise'])}. Anything else?"
         else:
             return "❌ I found the recipe but encountered an issue adding the items. Please try adding them individually."
 
     def list_cart(self) -> str:
         """Lists the current contents of the cart."""
-        if not self.cart['items']:
+        items = self.cart['items']
+        if not items:
             return "Your cart is empty! Ready to start shopping?"
         
-        details = ["🛍️ Here is what's in your cart:"]
-        for item in self.cart['items']:
-            details.append(f"  - {item['quantity_ordered']} {item['unit']} of {item['name']} (₹{item['line_total']:.2f})")
-            
-        details.append(f"\nSubtotal: ₹{self.cart['subtotal']:.2f}.")
-        return "\n".join(details)
+        # str.join builds a list from a generator anyway, so hand it one directly
+        body = "\n".join([
+            f"  - {item.quantity_ordered} {item.unit} of {item.name} ({format_money(item.line_total_paise)})"
+            for item in items.values()
+        ])
+        return f"🛍️ Here is what's in your cart:\n{body}\n\nSubtotal: {format_money(self.cart['subtotal_paise'])}."
 
     def remove_item_from_cart(self, item_name: str, quantity: float = 0.0) -> str:
         """Removes a specified quantity of an item from the cart, or the whole item."""
         item_name_lower = item_name.lower()
         
-        for i, item in enumerate(self.cart['items']):
-            if item['name'].lower() == item_name_lower:
-                
-                # Case 1: Remove the entire item (quantity is 0.0 or more than available)
-                if quantity <= 0.0 or quantity >= item['quantity_ordered']:
-                    removed_quantity = item['quantity_ordered']
-                    del self.cart['items'][i]
-                    self._update_cart_total()
-                    return f"🗑️ Removed all {removed_quantity} {item['unit']} of **{item['name']}** from your cart. Your new subtotal is ₹{self.cart['subtotal']:.2f}."
-                
-                # Case 2: Remove a specific quantity
-                else:
-                    item['quantity_ordered'] -= quantity
-                    item['line_total'] = round(item['price_per_unit'] * item['quantity_ordered'], 2)
-                    self._update_cart_total()
-                    return f"🗑️ Removed {quantity} {item['unit']} of **{item['name']}**. You now have {item['quantity_ordered']} remaining. Your new subtotal is ₹{self.cart['subtotal']:.2f}."
+        item = self.cart['items'].get(item_name_lower)
+        if item:
+            
+            # Case 1: Remove the entire item (quantity is 0.0 or more than available)
+            if quantity <= 0.0 or quantity >= item.quantity_ordered:
+                removed_quantity = item.quantity_ordered
+                del self.cart['items'][item_name_lower]
+                self._adjust_subtotal(-item.line_total_paise)
+                return f"🗑️ Removed all {removed_quantity} {item.unit} of **{item.name}** from your cart. Your new subtotal is {format_money(self.cart['subtotal_paise'])}."
+            
+            # Case 2: Remove a specific quantity
+            else:
+                self._adjust_subtotal(item.set_quantity(item.quantity_ordered - quantity))
+                return f"🗑️ Removed {quantity} {item.unit} of **{item.name}**. You now have {item.quantity_ordered} remaining. Your new subtotal is {format_money(self.cart['subtotal_paise'])}."
 
         return f"❌ I couldn't find **{item_name}** in your cart to remove it. Please check your cart contents."
         
@@ -183,29 +309,38 @@ class GroceryAgentLogic:
         if not self.cart['items']:
             return {"status": "error", "message": "Cannot place order: cart is empty."}
 
-        delivery_fee = 40.00
-        grand_total = round(self.cart['subtotal'] + delivery_fee, 2)
-        order_id = f"ODR-{datetime.now().strftime('%Y%m%d')}-{uuid.uuid4().hex[:6].upper()}"
+        subtotal_paise = self.cart['subtotal_paise']
+        delivery_fee_paise = 4000
+        grand_total_paise = subtotal_paise + delivery_fee_paise
+        grand_total = grand_total_paise / 100
+        # One clock read, so the id's date and the timestamp can't straddle midnight
+        now = datetime.now()
+        order_id = f"ODR-{now.strftime('%Y%m%d')}-{uuid.uuid4().hex[:6].upper()}"
         
         order_data = {
             "order_id": order_id,
             "customer_name": customer_name,
             "delivery_address": address,
-            "order_timestamp": datetime.now().isoformat(),
+            "order_timestamp": now.isoformat(),
             "status": "Placed",
-            "items": self.cart['items'],
-            "subtotal": self.cart['subtotal'],
-            "delivery_fee": delivery_fee,
+            # Order files keep the rupee amounts they have always had
+            "items": [item.to_order_dict() for item in self.cart['items'].values()],
+            "subtotal": subtotal_paise / 100,
+            "delivery_fee": delivery_fee_paise / 100,
             "grand_total": grand_total
         }
         
         filename = ORDERS_DIR.joinpath(f"{order_id}.json")
         try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(order_data, f, indent=4)
+            blob = json_utils.dumps_bytes(order_data, indent=True)
+            if self.order_queue is not None:
+                self.order_queue.put_nowait((filename, blob))
+            else:
+                # No writer running (e.g. used outside a job): write it directly
+                write_order_file(filename, blob)
             
             # Clear cart for new transaction
-            self.cart = {"items": [], "subtotal": 0.00}
+            self.cart = {"items": {}, "subtotal_paise": 0}
             
             return {
                 "status": "success", 
@@ -213,7 +348,7 @@ class GroceryAgentLogic:
                 "grand_total": grand_total,
                 "verbal_summary": (
                     f"Order placed successfully! Your Order ID is {order_id}. "
-                    f"Your total is ₹{grand_total:.2f}, including the ₹{delivery_fee:.2f} delivery fee. "
+                    f"Your total is {format_money(grand_total_paise)}, including the {format_money(delivery_fee_paise)} delivery fee. "
                     f"We are now processing your order. Thank you for shopping with us!"
                 )
             }
@@ -222,72 +357,9 @@ class GroceryAgentLogic:
             return {"status": "error", "message": "An internal error occurred while saving the order."}
 
 
-# --- Initialize Logic Instance and Tool Functions ---
-
-# Initialize the state management instance once at startup
-GROCERY_LOGIC = GroceryAgentLogic()
-
-@function_tool
-async def add_item_tool(ctx: RunContext[None], item_name: str, quantity: float = 1.0) -> str:
-    """
-    Adds a specific item (e.g., 'Amul Fresh Milk') and its quantity (e.g., 2.0) to the user's cart. 
-    Always use this tool when the user asks for a single product. 
-    You must ask for clarification if the item name is ambiguous or the quantity is missing.
-    Args:
-        item_name: The name of the grocery item (e.g., Whole Wheat Bread).
-        quantity: The numeric quantity to add (e.g., 2.0). Defaults to 1.0 if not specified by the user.
-    """
-    return await asyncio.to_thread(GROCERY_LOGIC.add_item_to_cart, item_name, quantity)
-
-@function_tool
-async def add_recipe_tool(ctx: RunContext[None], recipe_phrase: str) -> str:
-    """
-    Adds all necessary ingredients for a high-level request (e.g., 'ingredients for X') to the cart. 
-    The agent knows simple recipes like 'simple pasta dinner' or 'egg curry'.
-    Always use this tool for bundled ingredient requests.
-    Args:
-        recipe_phrase: The high-level request (e.g., 'simple pasta dinner').
-    """
-    return await asyncio.to_thread(GROCERY_LOGIC.add_recipe_to_cart, recipe_phrase)
-
-@function_tool
-async def list_cart_tool(ctx: RunContext[None]) -> str:
-    """
-    Tells the user what items are currently in their shopping cart and the current subtotal.
-    Use this tool when the user asks "What's in my cart?" or "What do I have so far?"
-    """
-    return await asyncio.to_thread(GROCERY_LOGIC.list_cart)
-
-@function_tool
-async def remove_item_tool(ctx: RunContext[None], item_name: str, quantity: float = 0.0) -> str:
-    """
-    Removes a specific quantity of an item from the cart. If the quantity is zero or not specified, the entire item is removed.
-    Use this tool when the user says they want to remove, delete, or take out an item.
-    Args:
-        item_name: The name of the item to remove (e.g., 'Tomato').
-        quantity: The numeric quantity to remove (e.g., 1.0). If 0 or omitted, the whole item is removed.
-    """
-    return await asyncio.to_thread(GROCERY_LOGIC.remove_item_from_cart, item_name, quantity)
-
-@function_tool
-async def place_order_tool(ctx: RunContext[None], customer_name: str, address: str) -> str:
-    """
-    Finalizes the order, saves the order details to a JSON file for persistence, and clears the cart.
-    This tool MUST be called when the user confirms they are finished ordering (e.g., "Place my order", "I'm done").
-    Args:
-        customer_name: The customer's name (e.g., 'Parij').
-        address: The simple text of the delivery address (e.g., 'Flat 4A, Orchid Tower, Seawoods').
-    """
-    result = await asyncio.to_thread(GROCERY_LOGIC.place_order_and_save, customer_name, address)
-    return result['verbal_summary'] if result['status'] == 'success' else result['message']
-
-
 # --- The LiveKit Assistant Class ---
 
-class Assistant(Agent):
-    def __init__(self) -> None:
-        super().__init__(
-            instructions="""You are a helpful, friendly, and curious Food & Grocery Ordering Assistant for a fictional brand called QuickMart.
+_INSTRUCTIONS = """You are a helpful, friendly, and curious Food & Grocery Ordering Assistant for a fictional brand called QuickMart.
             The customer is ordering products from a large catalog. Your primary goal is to assist the user in adding items to their cart.
             Your responses are concise and friendly.
             
@@ -301,14 +373,90 @@ class Assistant(Agent):
             5. When the user signals they are done (e.g., "That's all," "Place the order"):
                - Ask for their **name** and **delivery address** if you don't have it.
                - Once confirmed, call the `place_order_tool` to finalize the transaction and hang up.
-            """,
-            tools=[add_item_tool, add_recipe_tool, list_cart_tool, remove_item_tool, place_order_tool] # Tool list updated
-        )
+            """
+
+
+class Assistant(Agent):
+    def __init__(self, logic: GroceryAgentLogic) -> None:
+        # Each session gets its own logic (and so its own cart); the tools below act on it
+        self.logic = logic
+        super().__init__(instructions=_INSTRUCTIONS)
+
+    # The cart methods are in-memory dict work, so the tools call them inline on the event
+    # loop rather than paying a thread hop per call (which also keeps cart updates serialized).
+
+    @function_tool
+    async def add_item_tool(self, ctx: RunContext, item_name: str, quantity: float = 1.0) -> str:
+        """
+        Adds a specific item (e.g., 'Amul Fresh Milk') and its quantity (e.g., 2.0) to the user's cart. 
+        Always use this tool when the user asks for a single product. 
+        You must ask for clarification if the item name is ambiguous or the quantity is missing.
+        Args:
+            item_name: The name of the grocery item (e.g., Whole Wheat Bread).
+            quantity: The numeric quantity to add (e.g., 2.0). Defaults to 1.0 if not specified by the user.
+        """
+        return self.logic.add_item_to_cart(item_name, quantity)
+
+    @function_tool
+    async def add_recipe_tool(self, ctx: RunContext, recipe_phrase: str) -> str:
+        """
+        Adds all necessary ingredients for a high-level request (e.g., 'ingredients for X') to the cart. 
+        The agent knows simple recipes like 'simple pasta dinner' or 'egg curry'.
+        Always use this tool for bundled ingredient requests.
+        Args:
+            recipe_phrase: The high-level request (e.g., 'simple pasta dinner').
+        """
+        return self.logic.add_recipe_to_cart(recipe_phrase)
+
+    @function_tool
+    async def list_cart_tool(self, ctx: RunContext) -> str:
+        """
+        Tells the user what items are currently in their shopping cart and the current subtotal.
+        Use this tool when the user asks "What's in my cart?" or "What do I have so far?"
+        """
+        return self.logic.list_cart()
+
+    @function_tool
+    async def remove_item_tool(self, ctx: RunContext, item_name: str, quantity: float = 0.0) -> str:
+        """
+        Removes a specific quantity of an item from the cart. If the quantity is zero or not specified, the entire item is removed.
+        Use this tool when the user says they want to remove, delete, or take out an item.
+        Args:
+            item_name: The name of the item to remove (e.g., 'Tomato').
+            quantity: The numeric quantity to remove (e.g., 1.0). If 0 or omitted, the whole item is removed.
+        """
+        return self.logic.remove_item_from_cart(item_name, quantity)
+
+    @function_tool
+    async def place_order_tool(self, ctx: RunContext, customer_name: str, address: str) -> str:
+        """
+        Finalizes the order, saves the order details to a JSON file for persistence, and clears the cart.
+        This tool MUST be called when the user confirms they are finished ordering (e.g., "Place my order", "I'm done").
+        Args:
+            customer_name: The customer's name (e.g., 'Parij').
+            address: The simple text of the delivery address (e.g., 'Flat 4A, Orchid Tower, Seawoods').
+        """
+        # The file write happens in the background order writer, so this returns right away
+        result = self.logic.place_order_and_save(customer_name, address)
+        return result['verbal_summary'] if result['status'] == 'success' else result['message']
 
 def prewarm(proc: JobProcess):
     proc.userdata["vad"] = silero.VAD.load()
+    proc.userdata["catalog"] = GroceryAgentLogic.load_catalog()
 
 async def entrypoint(ctx: JobContext):
+    order_queue = asyncio.Queue()
+    writer = asyncio.create_task(order_writer(order_queue))
+    # Per-session cart on top of the catalog parsed once per process in prewarm
+    logic = GroceryAgentLogic(catalog=ctx.proc.userdata["catalog"], order_queue=order_queue)
+
+    async def flush_orders():
+        # Every placed order must be on disk before the job exits
+        await order_queue.join()
+        writer.cancel()
+
+    ctx.add_shutdown_callback(flush_orders)
+
     # Initialize the LLM, STT, and TTS components
     session = AgentSession(
         stt=deepgram.STT(model="nova-3"),
@@ -321,7 +469,7 @@ async def entrypoint(ctx: JobContext):
 
     # Start the session, passing the Assistant agent with its tools and instructions
     await session.start(
-        agent=Assistant(),
+        agent=Assistant(logic),
         room=ctx.room,
     )
 
@@ -1,5 +1,4 @@
 import logging
-import json
 import os
 from datetime import datetime
 from dataclasses import dataclass, field
@@ -23,6 +22,8 @@ from livekit.agents import (
 from livekit.plugins import murf, silero, google, deepgram, noise_cancellation
 from livekit.plugins.turn_detector.multilingual import MultilingualModel
 
+import json_utils
+
 logger = logging.getLogger("agent")
 
 # Load environment variables (ensure your .env.local file has your keys!)
@@ -30,10 +31,14 @@ load_dotenv(".env.local")
 
 # --- 1. DATA SCHEMA AND PERSISTENCE SETUP ---
 
+def _now_iso() -> str:
+    # Use isoformat for easy sorting and reading
+    return datetime.now().isoformat()
+
+
 @dataclass
 class WellnessEntry:
-    # Use isoformat for easy sorting and reading
-    timestamp: str = field(default_factory=lambda: datetime.now().isoformat())
+    timestamp: str = field(default_factory=_now_iso)
     mood: Optional[str] = None
     energy: Optional[str] = None
     stress: Optional[str] = None
@@ -41,33 +46,101 @@ class WellnessEntry:
     agent_summary: Optional[str] = None
 
 # This file will be saved in the same directory where 'python src/agent.py dev' is run (the 'backend' folder)
-LOG_FILE_PATH = "wellness_log.json"
+# One JSON object per line, so a check-in only appends its own record instead of
+# rewriting the whole history.
+LOG_FILE_PATH = "wellness_log.jsonl"
+# Older versions kept the whole history as one pretty-printed JSON array
+LEGACY_LOG_FILE_PATH = "wellness_log.json"
 
-# Helper function to read the log (Contextual Memory)
-def load_wellness_log() -> List[Dict[str, Any]]:
-    """Reads the JSON log file and returns all historical check-in data."""
-    if not os.path.exists(LOG_FILE_PATH):
-        return []
+
+def migrate_legacy_log() -> None:
+    """Converts a legacy wellness_log.json array into the JSONL log, once."""
+    if os.path.exists(LOG_FILE_PATH) or not os.path.exists(LEGACY_LOG_FILE_PATH):
+        return
     try:
-        with open(LOG_FILE_PATH, 'r') as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        print(f"Warning: {LOG_FILE_PATH} is empty or corrupt. Starting fresh.")
-        return []
+        with open(LEGACY_LOG_FILE_PATH, 'rb') as f:
+            entries = json_utils.loads(f.read())
+    except json_utils.JSONDecodeError:
+        print(f"Warning: {LEGACY_LOG_FILE_PATH} is empty or corrupt. Not migrating it.")
+        return
+    if not isinstance(entries, list):
+        return
+    # Write to a temp file first so a crash can't leave a half-migrated log behind
+    tmp_path = LOG_FILE_PATH + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(b"".join(json_utils.dumps_bytes(e, newline=True) for e in entries))
+    os.replace(tmp_path, LOG_FILE_PATH)
+    print(f"Migrated {len(entries)} entries from {LEGACY_LOG_FILE_PATH} to {LOG_FILE_PATH}.")
+
+
+def append_log_entry(path: str, entry: Dict[str, Any]) -> None:
+    """Appends one record to a JSONL log."""
+    blob = json_utils.dumps_bytes(entry, newline=True)
+    with open(path, 'a+b') as f:
+        if f.seek(0, os.SEEK_END) > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                # The last write was torn; start a fresh line so this record isn't glued to it
+                blob = b"\n" + blob
+        f.write(blob)
+
+
+# Helper function to read the log (Contextual Memory)
+def _tail_entry(path: str, block_size: int = 4096) -> Optional[Dict[str, Any]]:
+    """Returns the last intact record of a JSONL log, reading only the end of the file."""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        pos = f.seek(0, os.SEEK_END)
+        partial = b""
+        # Walk back a block at a time, trying complete lines newest first
+        while pos > 0:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            lines = (f.read(step) + partial).split(b"\n")
+            # Unless we've reached the start of the file, the first piece may be cut off
+            partial = lines.pop(0) if pos > 0 else b""
+            for line in reversed(lines):
+                if not line.strip():
+                    continue
+                try:
+                    return json_utils.loads(line)
+                except json_utils.JSONDecodeError:
+                    # e.g. a write torn by a crash; the history before it is still good
+                    print(f"Warning: skipping a corrupt line in {path}.")
+    return None
 
 
 # --- 2. THE WELLNESS COMPANION AGENT CLASS ---
 
+# Static prompt body, built once at import; only the history slot is filled per session.
+_INSTRUCTIONS_TEMPLATE = """
+            You are 'Aura', a grounded, supportive, non-diagnostic Health and Wellness Companion. You conduct short daily check-ins.
+
+            **CONVERSATION GOALS:**
+            1. **GREETING:** Greet the user and immediately reference their *last check-in data* from the provided CONTEXTUAL HISTORY.
+            2. **DATA GATHERING:** Ask about their current mood, energy level, and 1-3 simple, practical objectives for today.
+            3. **ADVICE:** Offer small, actionable, non-medical advice or reflections (e.g., encourage breaks, break down goals).
+            4. **RECAP & PERSISTENCE:** Once ALL required data (mood, energy, objectives, and an agent_summary) is gathered, you MUST call the 'save_check_in' tool.
+
+            **REQUIRED DATA FIELDS FOR TOOL CALL:** mood (str), energy (str), objectives (List[str]), agent_summary (str).
+            **RESTRICTIONS:** DO NOT offer medical diagnosis, complex therapy, or overly optimistic claims. Keep it realistic and supportive.
+
+            {history_summary}
+            """
+
+
 class WellnessCompanion(Agent): # <-- The main agent logic class
     def __init__(self) -> None:
-        # Load history immediately upon agent creation for contextual memory
-        self.history = load_wellness_log()
+        # Only the most recent check-in feeds the prompt, so read just the log's last line
+        migrate_legacy_log()
+        self.last_entry = _tail_entry(LOG_FILE_PATH)
         
         # --- Prepare Dynamic Context ---
         history_summary = "There is no past history available. Conduct a first-time check-in."
-        if self.history:
-            # Get the most recent entry for dynamic context in the prompt
-            last_entry = self.history[-1]
+        if self.last_entry:
+            last_entry = self.last_entry
             last_mood = last_entry.get("mood", "undocumented")
             
             last_time_str = ""
@@ -84,20 +157,7 @@ class WellnessCompanion(Agent): # <-- The main agent logic class
             )
 
         super().__init__(
-            instructions=f"""
-            You are 'Aura', a grounded, supportive, non-diagnostic Health and Wellness Companion. You conduct short daily check-ins.
-
-            **CONVERSATION GOALS:**
-            1. **GREETING:** Greet the user and immediately reference their *last check-in data* from the provided CONTEXTUAL HISTORY.
-            2. **DATA GATHERING:** Ask about their current mood, energy level, and 1-3 simple, practical objectives for today.
-            3. **ADVICE:** Offer small, actionable, non-medical advice or reflections (e.g., encourage breaks, break down goals).
-            4. **RECAP & PERSISTENCE:** Once ALL required data (mood, energy, objectives, and an agent_summary) is gathered, you MUST call the 'save_check_in' tool.
-
-            **REQUIRED DATA FIELDS FOR TOOL CALL:** mood (str), energy (str), objectives (List[str]), agent_summary (str).
-            **RESTRICTIONS:** DO NOT offer medical diagnosis, complex therapy, or overly optimistic claims. Keep it realistic and supportive.
-
-            {history_summary}
-            """,
+            instructions=_INSTRUCTIONS_TEMPLATE.format(history_summary=history_summary),
         )
 
     # --- IMPLEMENT THE SAVE_CHECK_IN FUNCTION TOOL ---
@@ -106,7 +166,7 @@ class WellnessCompanion(Agent): # <-- The main agent logic class
         description="Call this function only ONCE at the end of a session when ALL required data (mood, energy, objectives, agent_summary) has been collected. It persists the data.",
     )
     async def save_check_in(self, ctx: RunContext, mood: str, energy: str, objectives: List[str], agent_summary: str) -> str:
-        """Appends the final check-in data to wellness_log.json."""
+        """Appends the final check-in data to wellness_log.jsonl."""
         
         entry_data = WellnessEntry(
             mood=mood,
@@ -116,12 +176,8 @@ class WellnessCompanion(Agent): # <-- The main agent logic class
             agent_summary=agent_summary
         ).__dict__
         
-        log_entries = load_wellness_log()
-        log_entries.append(entry_data)
-        
         try:
-            with open(LOG_FILE_PATH, 'w') as f:
-                json.dump(log_entries, f, indent=4)
+            append_log_entry(LOG_FILE_PATH, entry_data)
         except Exception as e:
             print(f"Failed to save wellness log: {e}")
             return "Internal error: Failed to save the log entry. Please ask the user to confirm the information verbally."
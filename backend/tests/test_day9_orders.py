@@ -0,0 +1,74 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+import agent_day9
+from agent_day9 import ORDERS_FILE, SessionState, order_writer, persist_order
+
+
+@pytest.fixture(autouse=True)
+def orders_log(tmp_path, monkeypatch):
+    """Points the process-wide orders fd at an orders.json in a temp directory."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(agent_day9, "_ORDERS_FD", None)
+    yield
+    if agent_day9._ORDERS_FD is not None:
+        os.close(agent_day9._ORDERS_FD)
+
+
+def _start_session() -> SessionState:
+    state = SessionState(order_queue=asyncio.Queue())
+    state.order_writer_task = asyncio.create_task(order_writer(state.order_queue))
+    return state
+
+
+async def _flush(state: SessionState) -> None:
+    await state.order_queue.join()
+    state.order_writer_task.cancel()
+
+
+def _saved_ids() -> list:
+    with open(ORDERS_FILE, "rb") as f:
+        return [json.loads(line)["id"] for line in f]
+
+
+async def test_writer_appends_queued_orders_in_order() -> None:
+    state = _start_session()
+    for i in range(40):  # more than one ORDER_WRITE_BATCH
+        persist_order({"id": f"o{i}"}, state.order_queue)
+
+    await _flush(state)
+
+    assert _saved_ids() == [f"o{i}" for i in range(40)]
+
+
+async def test_orders_go_to_the_callers_session_queue() -> None:
+    first, second = _start_session(), _start_session()
+
+    persist_order({"id": "a"}, first.order_queue)
+    persist_order({"id": "b"}, second.order_queue)
+
+    assert first.order_queue.qsize() == 1
+    assert second.order_queue.qsize() == 1
+    await _flush(first)
+    await _flush(second)
+    assert sorted(_saved_ids()) == ["a", "b"]
+
+
+async def test_one_session_shutting_down_does_not_break_another() -> None:
+    first, second = _start_session(), _start_session()
+    persist_order({"id": "a"}, first.order_queue)
+    await _flush(first)
+
+    persist_order({"id": "b"}, second.order_queue)
+    await _flush(second)
+
+    assert _saved_ids() == ["a", "b"]
+
+
+def test_persist_without_a_queue_writes_directly() -> None:
+    persist_order({"id": "direct"})
+
+    assert _saved_ids() == ["direct"]
@@ -0,0 +1,106 @@
+import glob
+import json
+
+import pytest
+
+import agent_fraud
+from agent_fraud import (
+    FRAUD_DB_FILE,
+    FRAUD_UPDATES_CLAIMED_GLOB,
+    FRAUD_UPDATES_FILE,
+    TARGET_CUSTOMER_NAME,
+    compact_fraud_db_sync,
+    initialize_database_file,
+    load_fraud_case_sync,
+    read_case_updates_sync,
+    update_fraud_case_sync,
+)
+
+
+@pytest.fixture(autouse=True)
+def fraud_db(tmp_path, monkeypatch) -> None:
+    """Runs every test against a fresh fraud_cases.json in a temp directory."""
+    monkeypatch.chdir(tmp_path)
+    initialize_database_file()
+
+
+def _record(status: str) -> None:
+    case = load_fraud_case_sync(TARGET_CUSTOMER_NAME)
+    case["status"] = status
+    case["outcome_note"] = f"note for {status}"
+    update_fraud_case_sync(case)
+
+
+def _db_status() -> str:
+    with open(FRAUD_DB_FILE) as f:
+        return json.load(f)[0]["status"]
+
+
+def test_journaled_update_is_applied_on_load() -> None:
+    _record("confirmed_safe")
+
+    assert load_fraud_case_sync(TARGET_CUSTOMER_NAME)["status"] == "confirmed_safe"
+    # The DB itself is only rewritten by compaction
+    assert _db_status() == "pending_review"
+
+
+def test_compaction_folds_journal_into_db() -> None:
+    _record("confirmed_fraud")
+
+    compact_fraud_db_sync()
+
+    assert _db_status() == "confirmed_fraud"
+    assert not glob.glob(FRAUD_UPDATES_FILE + "*")
+    assert load_fraud_case_sync(TARGET_CUSTOMER_NAME)["status"] == "confirmed_fraud"
+
+
+def test_truncated_last_line_still_loads_and_compacts() -> None:
+    """A crash mid-append must not hide the case or wedge compaction."""
+    _record("confirmed_fraud")
+    with open(FRAUD_UPDATES_FILE, "ab") as f:
+        f.write(b'{"case_id": "FC00129", "stat')
+
+    assert load_fraud_case_sync(TARGET_CUSTOMER_NAME)["status"] == "confirmed_fraud"
+
+    compact_fraud_db_sync()
+
+    assert _db_status() == "confirmed_fraud"
+    assert not glob.glob(FRAUD_UPDATES_CLAIMED_GLOB)
+
+
+def test_update_after_torn_line_is_not_lost() -> None:
+    _record("confirmed_fraud")
+    with open(FRAUD_UPDATES_FILE, "ab") as f:
+        f.write(b'{"case_id": "FC0')
+
+    _record("confirmed_safe")
+
+    assert read_case_updates_sync()["FC00129"]["status"] == "confirmed_safe"
+
+
+def test_malformed_entries_are_skipped() -> None:
+    with open(FRAUD_UPDATES_FILE, "wb") as f:
+        f.write(b'[1, 2]\n{"status": "x", "outcome_note": "no case id"}\n\xff\xfe\n')
+    _record("confirmed_safe")
+
+    assert read_case_updates_sync() == {
+        "FC00129": {
+            "case_id": "FC00129",
+            "status": "confirmed_safe",
+            "outcome_note": "note for confirmed_safe",
+        }
+    }
+
+
+def test_unreadable_db_is_left_alone() -> None:
+    _record("confirmed_fraud")
+    with open(FRAUD_DB_FILE, "w") as f:
+        f.write("{not json")
+
+    compact_fraud_db_sync()
+
+    with open(FRAUD_DB_FILE) as f:
+        assert f.read() == "{not json"
+    # The update is kept (in a claimed journal) and still visible to readers
+    assert read_case_updates_sync()["FC00129"]["status"] == "confirmed_fraud"
+    assert not glob.glob(agent_fraud.FRAUD_COMPACT_LOCK)
@@ -0,0 +1,30 @@
+import pytest
+
+import json_utils
+
+
+@pytest.fixture(params=["orjson", "stdlib"])
+def backend(request, monkeypatch) -> str:
+    """Runs each test with orjson (when installed) and with the stdlib fallback."""
+    if request.param == "stdlib":
+        monkeypatch.setattr(json_utils, "orjson", None)
+    elif json_utils.orjson is None:
+        pytest.skip("orjson is not installed")
+    return request.param
+
+
+def test_round_trip(backend: str) -> None:
+    obj = {"name": "Café", "items": [1, 2.5, None, True]}
+
+    assert json_utils.loads(json_utils.dumps_bytes(obj)) == obj
+    assert json_utils.loads(json_utils.dumps(obj, indent=True)) == obj
+
+
+def test_newline_appends_one_line_feed(backend: str) -> None:
+    assert json_utils.dumps_bytes({"a": 1}, newline=True).endswith(b"}\n")
+
+
+@pytest.mark.parametrize("data", [b'{"a": 1', b"\xff", b"\xff\xfe", b'{"a": "\xc3"}', "[1,"])
+def test_malformed_input_raises_json_decode_error(backend: str, data) -> None:
+    with pytest.raises(json_utils.JSONDecodeError):
+        json_utils.loads(data)
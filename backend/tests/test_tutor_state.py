@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+import agent_tutor
+from agent_tutor import _bump, _record_score, _set_field, flush_state, get_state
+
+
+@pytest.fixture(autouse=True)
+def tutor_state(tmp_path, monkeypatch) -> None:
+    """Gives every test an empty state file and a fresh in-memory state."""
+    monkeypatch.setattr(agent_tutor, "STATE_PATH", str(tmp_path / "tutor_state.json"))
+    monkeypatch.setattr(agent_tutor, "_state", None)
+    monkeypatch.setattr(agent_tutor, "_flush_task", None)
+    monkeypatch.setattr(agent_tutor, "_state_write_lock", None)
+    monkeypatch.setattr(agent_tutor, "_pending_fields", {})
+    monkeypatch.setattr(agent_tutor, "_pending_mastery", {})
+
+
+def _new_session() -> None:
+    """Forgets this process's in-memory state, as a second tutor process would start out."""
+    agent_tutor._state = None
+
+
+def _saved() -> dict:
+    with open(agent_tutor.STATE_PATH) as f:
+        return json.load(f)
+
+
+def test_lock_is_not_created_at_import() -> None:
+    assert agent_tutor._state_write_lock is None
+
+
+async def test_flush_writes_recorded_changes() -> None:
+    state = get_state()
+    _set_field(state, "last_concept", "loops")
+    _bump(state, "loops", "times_quizzed")
+    _record_score(state, "loops", 100)
+
+    await flush_state()
+
+    saved = _saved()
+    assert saved["last_concept"] == "loops"
+    assert saved["mastery"]["loops"]["times_quizzed"] == 1
+    assert saved["mastery"]["loops"]["avg_score"] == 100
+
+
+async def test_concurrent_sessions_do_not_overwrite_each_other() -> None:
+    first = get_state()  # loaded before the other session writes anything
+    _bump(first, "loops", "times_explained")
+    _record_score(first, "loops", 100)
+    pending = agent_tutor._pending_fields, agent_tutor._pending_mastery
+
+    # Another session records and flushes in between
+    agent_tutor._pending_fields, agent_tutor._pending_mastery = {}, {}
+    _new_session()
+    second = get_state()
+    _bump(second, "loops", "times_explained")
+    _record_score(second, "loops", 0)
+    _bump(second, "variables", "times_taught_back")
+    await flush_state()
+
+    agent_tutor._state = first
+    agent_tutor._pending_fields, agent_tutor._pending_mastery = pending
+    await flush_state()
+
+    loops = _saved()["mastery"]["loops"]
+    assert loops["times_explained"] == 2
+    assert loops["times_scored"] == 2
+    assert loops["avg_score"] == 50
+    assert loops["last_score"] == 100
+    assert _saved()["mastery"]["variables"]["times_taught_back"] == 1
+    # The flushing session now sees the other session's progress as well
+    assert get_state()["mastery"]["variables"]["times_taught_back"] == 1
+
+
+async def test_failed_flush_keeps_changes_for_the_next_one(monkeypatch) -> None:
+    state = get_state()
+    _bump(state, "loops", "times_quizzed")
+    save_state = agent_tutor.save_state
+    monkeypatch.setattr(agent_tutor, "save_state", lambda data: False)
+    await flush_state()
+
+    monkeypatch.setattr(agent_tutor, "save_state", save_state)
+    await flush_state()
+
+    assert _saved()["mastery"]["loops"]["times_quizzed"] == 1
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+from wellness_agent import _tail_entry, append_log_entry
+
+
+@pytest.fixture
+def log_path(tmp_path) -> str:
+    return str(tmp_path / "wellness_log.jsonl")
+
+
+def _write_lines(path: str, records: list) -> None:
+    with open(path, "w") as f:
+        f.writelines(json.dumps(r) + "\n" for r in records)
+
+
+def test_missing_or_empty_log_has_no_tail(log_path: str) -> None:
+    assert _tail_entry(log_path) is None
+    open(log_path, "w").close()
+    assert _tail_entry(log_path) is None
+
+
+@pytest.mark.parametrize("block_size", [4, 16, 4096])
+def test_tail_is_last_record(log_path: str, block_size: int) -> None:
+    records = [{"mood": f"m{i}", "note": "x" * (i % 7) * 10} for i in range(50)]
+    _write_lines(log_path, records)
+
+    assert _tail_entry(log_path, block_size) == records[-1]
+
+
+@pytest.mark.parametrize("block_size", [4, 4096])
+def test_torn_last_line_falls_back_to_previous_record(log_path: str, block_size: int) -> None:
+    _write_lines(log_path, [{"mood": "ok"}, {"mood": "good"}])
+    with open(log_path, "ab") as f:
+        f.write(b'{"mood": "gr')
+
+    assert _tail_entry(log_path, block_size) == {"mood": "good"}
+
+
+def test_append_creates_log_and_adds_one_line_per_entry(log_path: str) -> None:
+    append_log_entry(log_path, {"mood": "ok"})
+    append_log_entry(log_path, {"mood": "good"})
+
+    with open(log_path) as f:
+        assert [json.loads(line) for line in f] == [{"mood": "ok"}, {"mood": "good"}]
+    assert _tail_entry(log_path) == {"mood": "good"}
+
+
+def test_append_after_torn_line_keeps_new_entry(log_path: str) -> None:
+    _write_lines(log_path, [{"mood": "ok"}])
+    with open(log_path, "ab") as f:
+        f.write(b'{"mood": "gr')
+
+    append_log_entry(log_path, {"mood": "calm"})
+    append_log_entry(log_path, {"mood": "tired"})
+
+    with open(log_path, "rb") as f:
+        lines = f.read().splitlines()
+    assert lines[-2:] == [b'{"mood":"calm"}', b'{"mood":"tired"}']
+    assert _tail_entry(log_path) == {"mood": "tired"}